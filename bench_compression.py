@@ -0,0 +1,69 @@
+import argparse
+import gzip
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from bench_serialization import populate, read_model_pipeline
+from compression import brotli, zstandard
+from db_definitions import DBSession
+
+
+def make_settings():
+    settings = [(f'gzip {level}', lambda body, level=level: gzip.compress(body, level, mtime=0)) for level in (1, 6, 9)]
+    if brotli is not None:
+        settings += [
+            (f'br {level}', lambda body, level=level: brotli.compress(body, quality=level))
+            for level in (1, 5, 9, 11)
+        ]
+    if zstandard is not None:
+        settings += [
+            (f'zstd {level}', lambda body, level=level: zstandard.ZstdCompressor(level=level).compress(body))
+            for level in (1, 3, 9, 19)
+        ]
+    return settings
+
+
+def measure(compress, body: bytes, repeat: int):
+    timings = []
+    compressed = b''
+    for _ in range(repeat):
+        started = time.process_time()
+        compressed = compress(body)
+        timings.append(time.process_time() - started)
+    return min(timings), len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare wire size and CPU cost of response compression levels')
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--pages', type=int, nargs='+', default=[20, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    session = DBSession()
+    try:
+        populate(session, args.posts, args.users)
+        bodies = [(page, read_model_pipeline(session, 1, page)) for page in args.pages]
+    finally:
+        session.close()
+
+    settings = make_settings()
+    if brotli is None or zstandard is None:
+        print('brotli or zstandard is not installed, only the available codecs are measured')
+    print(f'{"posts":>6}  {"encoding":<10}{"bytes":>10}{"ratio":>8}{"cpu ms":>10}{"MB/s":>10}')
+    for page, body in bodies:
+        print(f'{page:>6}  {"identity":<10}{len(body):>10}{1:>8.2f}{0:>10.3f}{"":>10}')
+        for name, compress in settings:
+            cpu, size = measure(compress, body, args.repeat)
+            print(
+                f'{page:>6}  {name:<10}{size:>10}{len(body) / size:>8.2f}{cpu * 1000:>10.3f}'
+                f'{len(body) / max(cpu, 1e-9) / 2 ** 20:>10.1f}'
+            )
+    print('cached variants are compressed once per encoding, later hits cost no compression cpu')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PATHS = ['/api/topic/0', '/api/thread/1']
+
+
+def populate(database_url: str, n_topics: int, n_posts: int):
+    os.environ['DATABASE_URL'] = database_url
+    from db_definitions import DBSession, Post, engine
+    from db_interactions import add_topic, add_thread, repair_counters
+    from migrations import migrate
+
+    migrate(engine)
+    session = DBSession()
+    try:
+        for i in range(n_topics):
+            add_topic(session, f'Topic {i}', 0, 0)
+        add_thread(session, 'Benchmark', False, 0, 0)
+        session.bulk_insert_mappings(Post, [
+            {'user_id': 0, 'text': f'Post number {i}', 'parent_id': 1}
+            for i in range(n_posts)
+        ])
+        session.commit()
+        repair_counters(session)
+    finally:
+        session.close()
+
+
+def wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(port: int, deadline: float, latencies: list, errors: list):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    i = 0
+    try:
+        while time.monotonic() < deadline:
+            path = PATHS[i % len(PATHS)]
+            i += 1
+            started = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode('ascii'))
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def load(port: int, concurrency: int, duration: float):
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        client(port, deadline, latencies, errors)
+        for _ in range(concurrency)
+    ))
+    return latencies, errors
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_mode(mode: str, database_url: str, port: int, args):
+    env = dict(os.environ, DATABASE_URL=database_url, DB_MODE=mode, RATE_LIMIT_RATE='0', RATE_LIMIT_READ_RATE='0')
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'uvicorn', 'main:app',
+            '--port', str(port), '--log-level', 'warning'
+        ],
+        cwd=ROOT, env=env
+    )
+    try:
+        wait_for_port(port)
+        asyncio.run(load(port, args.concurrency, 1))
+        latencies, errors = asyncio.run(load(port, args.concurrency, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'mode': mode,
+        'rps': len(latencies) / args.duration,
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'errors': len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync and async DB modes under concurrent readers')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--topics', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url
+        if database_url is None:
+            database_url = f'sqlite:///{os.path.join(directory, "bench.sqlite")}'
+            populate(database_url, args.topics, args.posts)
+        results = [
+            run_mode(mode, database_url, args.port + i, args)
+            for i, mode in enumerate(args.modes)
+        ]
+
+    print(f'{"mode":<8}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for result in results:
+        print(
+            f'{result["mode"]:<8}{result["rps"]:>10.1f}{result["p50"]:>10.2f}'
+            f'{result["p99"]:>10.2f}{result["errors"]:>8}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import time
+
+from passwords import Sha512Hasher, Pbkdf2Hasher, ScryptHasher
+from passwords import make_salt, check_password_async, PASSWORD_HASH_WORKERS, PASSWORD_HASH_EXECUTOR
+
+SETTINGS = [
+    Sha512Hasher(),
+    Pbkdf2Hasher(100000),
+    Pbkdf2Hasher(260000),
+    Pbkdf2Hasher(600000),
+    ScryptHasher(2 ** 12, 8, 1),
+    ScryptHasher(2 ** 14, 8, 1),
+    ScryptHasher(2 ** 15, 8, 1),
+    ScryptHasher(2 ** 16, 8, 1)
+]
+
+
+def describe(hasher) -> str:
+    if isinstance(hasher, Pbkdf2Hasher):
+        return f'{hasher.name} i={hasher.iterations}'
+    if isinstance(hasher, ScryptHasher):
+        return f'{hasher.name} n=2^{hasher.n.bit_length() - 1},r={hasher.r},p={hasher.p}'
+    return hasher.name
+
+
+async def logins(hasher, n_logins: int, concurrency: int):
+    salt = make_salt()
+    password_hash = hasher.encode('Password1', salt)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            assert await check_password_async('Password1', password_hash, salt)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(n_logins)))
+    elapsed = time.perf_counter() - started
+    return n_logins / elapsed, sum(latencies) / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure login throughput for each password hash cost setting')
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    print(f'executor: {PASSWORD_HASH_EXECUTOR}, workers: {PASSWORD_HASH_WORKERS}')
+    print(f'{"setting":<28}{"logins/s":>10}{"mean ms":>10}')
+    for hasher in SETTINGS:
+        rate, latency = asyncio.run(logins(hasher, args.logins, args.concurrency))
+        print(f'{describe(hasher):<28}{rate:>10.1f}{latency * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
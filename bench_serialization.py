@@ -0,0 +1,100 @@
+import argparse
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from humps import camelize
+from sqlalchemy.orm import joinedload
+
+import schema
+from db_definitions import Base, DBSession, Thread, Post, User
+from db_interactions import get_thread, get_thread_path
+from read_models import render_json, thread_response
+
+
+def populate(session, n_posts: int, n_users: int):
+    Base.metadata.create_all(session.get_bind())
+    session.bulk_insert_mappings(User, [
+        {'id': i, 'name': f'User{i}', 'password_hash': '', 'password_salt': ''}
+        for i in range(n_users)
+    ])
+    session.add(Thread(id=1, title='Benchmark', is_vegan=False))
+    session.bulk_insert_mappings(Post, [
+        {'user_id': i % n_users, 'text': f'Post number {i} ' * 4, 'parent_id': 1}
+        for i in range(n_posts)
+    ])
+    session.commit()
+
+
+def orm_pipeline(session, thread_id: int, limit: int) -> bytes:
+    thread = session.query(Thread).get(thread_id)
+    posts = session.query(Post)\
+        .options(joinedload(Post.user))\
+        .filter(Post.parent_id == thread_id)\
+        .order_by(Post.id)\
+        .limit(limit)\
+        .all()
+    data = schema.Thread(
+        title=thread.title,
+        path=get_thread_path(session, thread.parent_id),
+        posts=(
+            schema.PostData(
+                **camelize(
+                    schema.DBPost.from_orm(post).dict()
+                ),
+                user=schema.User.from_orm(post.user)
+            )
+            for post in posts
+        )
+    )
+    response = schema.ThreadResponse(data=data)
+    return JSONResponse(content=jsonable_encoder(response)).body
+
+
+def read_model_pipeline(session, thread_id: int, limit: int) -> bytes:
+    thread, next_cursor = get_thread(session, thread_id, None, limit)
+    return render_json(thread_response(thread, next_cursor))
+
+
+def measure(pipeline, n_posts: int, repeat: int):
+    timings = []
+    body = b''
+    for _ in range(repeat):
+        session = DBSession()
+        try:
+            started = time.perf_counter()
+            body = pipeline(session, 1, n_posts)
+            timings.append(time.perf_counter() - started)
+        finally:
+            session.close()
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-row serialization cost of thread pages')
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    session = DBSession()
+    try:
+        populate(session, args.posts, args.users)
+    finally:
+        session.close()
+
+    before, before_body = measure(orm_pipeline, args.posts, args.repeat)
+    after, after_body = measure(read_model_pipeline, args.posts, args.repeat)
+    identical = before_body == after_body
+
+    print(f'{"pipeline":<12}{"total ms":>10}{"us/row":>10}')
+    print(f'{"orm":<12}{before * 1000:>10.1f}{before / args.posts * 1e6:>10.2f}')
+    print(f'{"read model":<12}{after * 1000:>10.1f}{after / args.posts * 1e6:>10.2f}')
+    print(f'speedup: {before / after:.1f}x, identical bytes: {identical}')
+
+
+if __name__ == '__main__':
+    main()
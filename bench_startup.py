@@ -0,0 +1,81 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_MAIN = '''
+import time
+started = time.perf_counter()
+import main
+print(time.perf_counter() - started)
+'''
+
+STARTUP_WORK = '''
+import time
+from db_definitions import Base, DBSession, engine, Topic, User
+from migrations import check_schema, ROOT_PASSWORD
+from passwords import make_password
+
+def create_all_startup():
+    Base.metadata.create_all(engine)
+    session = DBSession()
+    session.query(User).filter(User.id == 0).count()
+    session.query(Topic).filter(Topic.id == 0).count()
+    session.close()
+    make_password(ROOT_PASSWORD)
+
+def version_check_startup():
+    check_schema(engine)
+
+for step in (create_all_startup, version_check_startup):
+    started = time.perf_counter()
+    step()
+    print(step.__name__, time.perf_counter() - started)
+'''
+
+
+def run(code: str, env: dict) -> str:
+    return subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env,
+        check=True, capture_output=True, text=True
+    ).stdout
+
+
+def median_ms(values) -> float:
+    return statistics.median(values) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold-start time against a migrated database')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', help='defaults to a fresh SQLite file in a temporary directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f'sqlite:///{os.path.join(directory, "bench.sqlite")}'
+        env = {**os.environ, 'DATABASE_URL': database_url}
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'migrate.py'], cwd=ROOT, env=env, check=True, capture_output=True)
+        migrate_seconds = time.perf_counter() - started
+
+        imports = [float(run(IMPORT_MAIN, env)) for _ in range(args.runs)]
+        steps = {}
+        for _ in range(args.runs):
+            for line in run(STARTUP_WORK, env).splitlines():
+                name, seconds = line.split()
+                steps.setdefault(name, []).append(float(seconds))
+
+    print(f'{"step":<24}{"median ms":>12}')
+    print(f'{"migrate (once)":<24}{migrate_seconds * 1000:>12.1f}')
+    print(f'{"import main":<24}{median_ms(imports):>12.1f}')
+    for name, values in steps.items():
+        print(f'{name:<24}{median_ms(values):>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
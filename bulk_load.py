@@ -0,0 +1,207 @@
+import argparse
+import csv
+import io
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import select, func, text
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud '
+    'exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure '
+    'in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint '
+    'occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est laborum'
+).split()
+START_TIME = datetime(2021, 1, 1)
+
+
+def sentence(rng: random.Random, n_words: int) -> str:
+    return ' '.join(rng.choices(WORDS, k=n_words)).capitalize() + '.'
+
+
+def topic_count(depth: int, fanout: int) -> int:
+    return sum(fanout ** level for level in range(1, depth + 1))
+
+
+def topic_id(index: int, offset: int) -> int:
+    return 0 if index == 0 else offset + index - 1
+
+
+def make_users(args, offset: int, password_hash: str, password_salt: str) -> Iterator[dict]:
+    for i in range(args.users):
+        yield {
+            'id': offset + i,
+            'name': f'User{offset + i}',
+            'password_hash': password_hash,
+            'password_salt': password_salt
+        }
+
+
+def make_topics(args, offset: int, user_offset: int) -> Iterator[dict]:
+    rng = random.Random(f'{args.seed}:topics')
+    for i in range(topic_count(args.depth, args.fanout)):
+        yield {
+            'id': offset + i,
+            'title': sentence(rng, 2),
+            'parent_id': 0 if i < args.fanout else offset + i // args.fanout - 1,
+            'user_id': user_offset + rng.randrange(args.users)
+        }
+
+
+def make_threads(args, offset: int, topic_offset: int, user_offset: int) -> Iterator[dict]:
+    rng = random.Random(f'{args.seed}:threads')
+    n_topics = topic_count(args.depth, args.fanout) + 1
+    for i in range(n_topics * args.threads):
+        yield {
+            'id': offset + i,
+            'title': sentence(rng, 3),
+            'is_vegan': rng.random() < 0.5,
+            'parent_id': topic_id(i // args.threads, topic_offset),
+            'user_id': user_offset + rng.randrange(args.users)
+        }
+
+
+def make_posts(args, offset: int, thread_offset: int, user_offset: int) -> Iterator[dict]:
+    rng = random.Random(f'{args.seed}:posts')
+    n_threads = (topic_count(args.depth, args.fanout) + 1) * args.threads
+    for i in range(n_threads * args.posts):
+        yield {
+            'id': offset + i,
+            'user_id': user_offset + rng.randrange(args.users),
+            'text': sentence(rng, 5 + rng.randrange(26)),
+            'parent_id': thread_offset + i // args.posts,
+            'created_at': START_TIME + timedelta(seconds=i)
+        }
+
+
+def chunks(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_rows(connection, table, chunk: List[dict]):
+    columns = list(chunk[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chunk:
+        writer.writerow(row[column] for column in columns)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer
+    )
+
+
+def load(engine, table, rows: Iterator[dict], total: int, args) -> Tuple[int, float]:
+    use_copy = args.copy and engine.dialect.driver == 'psycopg2'
+    loaded = 0
+    started = time.perf_counter()
+    for chunk in chunks(rows, args.chunk_size):
+        with engine.begin() as connection:
+            if use_copy:
+                copy_rows(connection, table, chunk)
+            else:
+                connection.execute(table.insert(), chunk)
+        loaded += len(chunk)
+        elapsed = time.perf_counter() - started
+        print(
+            f'\r{table.name:<8}{loaded:>12}/{total:<12}{loaded / elapsed:>12.0f} rows/s',
+            end='', file=sys.stderr, flush=True
+        )
+    elapsed = time.perf_counter() - started
+    print(file=sys.stderr)
+    return loaded, elapsed
+
+
+def next_id(engine, table) -> int:
+    with engine.connect() as connection:
+        current = connection.execute(select(func.max(table.c.id))).scalar()
+    return 1 if current is None else current + 1
+
+
+def reset_sequences(engine, tables):
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as connection:
+        for table in tables:
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT coalesce(max(id), 1) FROM {table.name}))"
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a large deterministic forum dataset')
+    parser.add_argument('--depth', type=int, default=3, help='levels of topics below Home')
+    parser.add_argument('--fanout', type=int, default=10, help='child topics per topic')
+    parser.add_argument('--threads', type=int, default=10, help='threads per topic')
+    parser.add_argument('--posts', type=int, default=100, help='posts per thread')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--password', default='Password1', help='shared password of generated users')
+    parser.add_argument('--seed', default='0')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--copy', action='store_true', help='use COPY on PostgreSQL with psycopg2')
+    parser.add_argument('--drop', action='store_true', help='drop and recreate all tables first')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    if args.database_url is not None:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    from db_definitions import Base, DBSession, engine, use_primary, Topic, Thread, Post, User
+    from db_interactions import repair_counters
+    from migrations import migrate
+    from passwords import make_password
+    from search import rebuild_search_index
+
+    if args.drop:
+        Base.metadata.drop_all(engine)
+    migrate(engine)
+
+    users, topics, threads, posts = (table.__table__ for table in (User, Topic, Thread, Post))
+    user_offset = next_id(engine, users)
+    topic_offset = next_id(engine, topics)
+    thread_offset = next_id(engine, threads)
+    post_offset = next_id(engine, posts)
+    n_topics = topic_count(args.depth, args.fanout)
+    n_threads = (n_topics + 1) * args.threads
+    password_hash, password_salt = make_password(args.password)
+
+    started = time.perf_counter()
+    results = [
+        (users, *load(engine, users, make_users(args, user_offset, password_hash, password_salt), args.users, args)),
+        (topics, *load(engine, topics, make_topics(args, topic_offset, user_offset), n_topics, args)),
+        (threads, *load(engine, threads, make_threads(args, thread_offset, topic_offset, user_offset), n_threads, args)),
+        (posts, *load(engine, posts, make_posts(args, post_offset, thread_offset, user_offset), n_threads * args.posts, args))
+    ]
+    reset_sequences(engine, [users, topics, threads, posts])
+
+    counters_started = time.perf_counter()
+    session = DBSession()
+    use_primary(session)
+    try:
+        repair_counters(session)
+        search_started = time.perf_counter()
+        rebuild_search_index(session)
+    finally:
+        session.close()
+    finished = time.perf_counter()
+
+    print(f'{"table":<10}{"rows":>12}{"seconds":>10}{"rows/s":>12}')
+    for table, loaded, elapsed in results:
+        print(f'{table.name:<10}{loaded:>12}{elapsed:>10.2f}{loaded / max(elapsed, 1e-9):>12.0f}')
+    print(f'{"counters":<10}{"":>12}{search_started - counters_started:>10.2f}')
+    print(f'{"search":<10}{"":>12}{finished - search_started:>10.2f}')
+    print(f'{"total":<10}{sum(loaded for _, loaded, _ in results):>12}{finished - started:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
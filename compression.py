@@ -0,0 +1,106 @@
+from typing import Optional, Dict, Callable, Iterator, NamedTuple
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.environ['COMPRESSION_MIN_SIZE']) if 'COMPRESSION_MIN_SIZE' in os.environ else 1024
+GZIP_LEVEL = int(os.environ['GZIP_LEVEL']) if 'GZIP_LEVEL' in os.environ else 6
+BROTLI_LEVEL = int(os.environ['BROTLI_LEVEL']) if 'BROTLI_LEVEL' in os.environ else 5
+ZSTD_LEVEL = int(os.environ['ZSTD_LEVEL']) if 'ZSTD_LEVEL' in os.environ else 3
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    compressor: Callable[[], Callable[[Optional[bytes]], bytes]]
+
+
+def gzip_compressor():
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(chunk: Optional[bytes]) -> bytes:
+        if chunk is None:
+            return compressor.flush()
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return process
+
+
+def brotli_compressor():
+    compressor = brotli.Compressor(quality=BROTLI_LEVEL)
+
+    def process(chunk: Optional[bytes]) -> bytes:
+        if chunk is None:
+            return compressor.finish()
+        return compressor.process(chunk) + compressor.flush()
+    return process
+
+
+def zstd_compressor():
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def process(chunk: Optional[bytes]) -> bytes:
+        if chunk is None:
+            return compressor.flush()
+        return compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    return process
+
+
+def make_codecs() -> Dict[str, Codec]:
+    codecs = {}
+    if brotli is not None:
+        codecs['br'] = Codec(lambda body: brotli.compress(body, quality=BROTLI_LEVEL), brotli_compressor)
+    if zstandard is not None:
+        codecs['zstd'] = Codec(lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), zstd_compressor)
+    codecs['gzip'] = Codec(lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0), gzip_compressor)
+    return codecs
+
+
+codecs = make_codecs()
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in codecs:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return codecs[encoding].compress(body)
+
+
+def compress_stream(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    process = codecs[encoding].compressor()
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield process(None)
+
+
+def weak_etag(etag: str) -> str:
+    return etag if etag.startswith('W/') else 'W/' + etag
@@ -1,13 +1,19 @@
-from db_definitions import Base, DBSession
+from db_definitions import Base, DBSession, use_primary
+from migrations import create_schema
 from fake_data import populate_db
+from db_interactions import repair_counters
+from search import rebuild_search_index
 
 session = DBSession()
+use_primary(session)
 try:
     engine = session.get_bind()
 
     Base.metadata.drop_all(engine)
-    Base.metadata.create_all(engine)
+    create_schema(engine)
 
     populate_db(session)
+    repair_counters(session)
+    rebuild_search_index(session)
 finally:
     session.close()
@@ -1,24 +1,261 @@
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Index, Table
+from sqlalchemy.orm import relationship, backref
 
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import create_engine, event, select, literal
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
+from datetime import datetime
+from itertools import cycle
+from threading import Lock
+from time import perf_counter, monotonic
+from typing import Optional, List, Dict
 import os
 
 
-if 'DATABASE_URL' in os.environ:
-    engine = create_engine(
-        os.environ['DATABASE_URL']
-    )
-else:
-    engine = create_engine(
-        'sqlite:///db.sqlite',
-        connect_args={'check_same_thread': False}
-    )
+DATABASE_URL = os.environ['DATABASE_URL'] if 'DATABASE_URL' in os.environ else 'sqlite:///db.sqlite'
+DB_MODE = os.environ['DB_MODE'] if 'DB_MODE' in os.environ else 'sync'
+ASYNC_DB = DB_MODE == 'async'
+REPLICA_URLS = [url for url in os.environ['REPLICA_URLS'].split(',') if url] if 'REPLICA_URLS' in os.environ else []
+REPLICA_STICKY_SECONDS = float(os.environ['REPLICA_STICKY_SECONDS']) if 'REPLICA_STICKY_SECONDS' in os.environ else 5
+
+DB_POOL_SIZE = int(os.environ['DB_POOL_SIZE']) if 'DB_POOL_SIZE' in os.environ else 5
+DB_MAX_OVERFLOW = int(os.environ['DB_MAX_OVERFLOW']) if 'DB_MAX_OVERFLOW' in os.environ else 10
+DB_POOL_TIMEOUT = float(os.environ['DB_POOL_TIMEOUT']) if 'DB_POOL_TIMEOUT' in os.environ else 30
+DB_POOL_RECYCLE = int(os.environ['DB_POOL_RECYCLE']) if 'DB_POOL_RECYCLE' in os.environ else -1
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '0') == '1'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ['SQLITE_JOURNAL_MODE'] if 'SQLITE_JOURNAL_MODE' in os.environ else 'WAL',
+    'synchronous': os.environ['SQLITE_SYNCHRONOUS'] if 'SQLITE_SYNCHRONOUS' in os.environ else 'NORMAL',
+    'busy_timeout': int(os.environ['SQLITE_BUSY_TIMEOUT']) if 'SQLITE_BUSY_TIMEOUT' in os.environ else 5000,
+    'mmap_size': int(os.environ['SQLITE_MMAP_SIZE']) if 'SQLITE_MMAP_SIZE' in os.environ else 268435456,
+    'cache_size': int(os.environ['SQLITE_CACHE_SIZE']) if 'SQLITE_CACHE_SIZE' in os.environ else -65536,
+    'foreign_keys': os.environ['SQLITE_FOREIGN_KEYS'] if 'SQLITE_FOREIGN_KEYS' in os.environ else 'OFF'
+}
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite'
+}
+
+
+def normalize_url(url: str) -> str:
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def async_url(url: str) -> str:
+    scheme, rest = normalize_url(url).split('://', 1)
+    return ASYNC_DRIVERS.get(scheme, scheme) + '://' + rest
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def is_memory_sqlite(url: str) -> bool:
+    return is_sqlite(url) and (url.endswith('://') or ':memory:' in url)
+
+
+def connect_args(url: str) -> dict:
+    if is_sqlite(url):
+        return {'check_same_thread': False}
+    return {}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait_seconds: float, timed_out: bool):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class StatsPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        started = perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record(perf_counter() - started, timed_out)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class StatsQueuePool(StatsPoolMixin, QueuePool):
+    pass
+
+
+class StatsAsyncQueuePool(StatsPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+engines = {}
+
+
+def make_engine(name: str, url: str, is_async: bool = False):
+    url = async_url(url) if is_async else normalize_url(url)
+    options = {
+        'connect_args': connect_args(url),
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE
+    }
+    if not is_memory_sqlite(url):
+        options.update(
+            poolclass=StatsAsyncQueuePool if is_async else StatsQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+    if is_async:
+        new_engine = create_async_engine(url, **options)
+        sync_engine = new_engine.sync_engine
+    else:
+        new_engine = create_engine(url, **options)
+        sync_engine = new_engine
+    if is_sqlite(url):
+        event.listen(sync_engine, 'connect', set_sqlite_pragmas)
+    if isinstance(sync_engine.pool, StatsPoolMixin):
+        sync_engine.pool.stats = PoolStats()
+    engines[name] = sync_engine
+    return new_engine
 
-DBSession = sessionmaker(bind=engine)
+
+def pool_stats() -> dict:
+    stats = {}
+    for name, sync_engine in engines.items():
+        pool = sync_engine.pool
+        if not isinstance(pool, StatsPoolMixin):
+            continue
+        stats[name] = {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'checkouts': pool.stats.checkouts,
+            'timeouts': pool.stats.timeouts,
+            'wait_seconds_total': pool.stats.wait_seconds_total,
+            'wait_seconds_max': pool.stats.wait_seconds_max
+        }
+    return stats
+
+
+class RoutingSession(Session):
+    replicas = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replicas is None or self.info.get('primary'):
+            return super().get_bind(mapper, clause, **kw)
+        if self._flushing or clause is not None and not is_replica_safe(clause):
+            use_primary(self)
+            return super().get_bind(mapper, clause, **kw)
+        if clause is None:
+            return super().get_bind(mapper, clause, **kw)
+        if 'replica' not in self.info:
+            self.info['replica'] = next(self.replicas)
+        return self.info['replica']
+
+
+def is_replica_safe(clause) -> bool:
+    return clause.is_select and getattr(clause, '_for_update_arg', None) is None
+
+
+def use_primary(session: Session):
+    session.info['primary'] = True
+
+
+def begin_snapshot(session: Session):
+    bind = session.get_bind(clause=select(literal(1)))
+    if bind.dialect.name == 'sqlite':
+        session.connection(bind_arguments={'bind': bind}).exec_driver_sql('BEGIN')
+    else:
+        session.connection(bind_arguments={'bind': bind}, execution_options={'isolation_level': 'REPEATABLE READ'})
+
+
+class Stickiness:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.until: Dict[str, float] = {}
+        self.lock = Lock()
+
+    def stick(self, key: str):
+        with self.lock:
+            now = monotonic()
+            self.until[key] = now + self.seconds
+            if len(self.until) > 10000:
+                self.until = {key: until for key, until in self.until.items() if until > now}
+
+    def is_sticky(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        with self.lock:
+            return self.until.get(key, 0) > monotonic()
+
+
+stickiness = Stickiness(REPLICA_STICKY_SECONDS)
+
+
+@event.listens_for(Session, 'after_commit')
+def stick_writer_to_primary(session: Session):
+    key = session.info.get('sticky_key')
+    if key is not None and session.info.get('primary'):
+        stickiness.stick(key)
+
+
+engine = make_engine('primary', DATABASE_URL)
+replica_engines: List = [
+    make_engine(f'replica{i}', url)
+    for i, url in enumerate(REPLICA_URLS)
+]
+
+
+class ReplicaSession(RoutingSession):
+    replicas = cycle(replica_engines) if replica_engines else None
+
+
+DBSession = sessionmaker(bind=engine, class_=ReplicaSession)
+
+if ASYNC_DB:
+    async_engine = make_engine('primary_async', DATABASE_URL, is_async=True)
+    async_replica_engines = [
+        make_engine(f'replica{i}_async', url, is_async=True)
+        for i, url in enumerate(REPLICA_URLS)
+    ]
+
+    class AsyncReplicaSession(RoutingSession):
+        replicas = cycle([replica.sync_engine for replica in async_replica_engines]) if async_replica_engines else None
+
+    AsyncDBSession = sessionmaker(bind=async_engine, class_=AsyncSession, sync_session_class=AsyncReplicaSession)
 
 
 Base = declarative_base()
@@ -29,10 +266,20 @@ class Topic(Base):
 
     id = Column(Integer, primary_key=True)
     title = Column(String)
-    parent_id = Column(Integer, ForeignKey('topics.id'))
+    parent_id = Column(Integer, ForeignKey('topics.id', ondelete='CASCADE'), index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    num_topics = Column(Integer, nullable=False, default=0, server_default='0')
+    num_threads = Column(Integer, nullable=False, default=0, server_default='0')
+    num_posts = Column(Integer, nullable=False, default=0, server_default='0')
+    last_post_id = Column(Integer)
+    last_post_at = Column(DateTime)
+    last_post_user_id = Column(Integer)
 
-    parent = relationship('Topic', remote_side=[id], backref='children_topics')
+    parent = relationship(
+        'Topic', remote_side=[id],
+        backref=backref('children_topics', passive_deletes=True)
+    )
     user = relationship('User')
 
     def __repr__(self):
@@ -46,10 +293,15 @@ class Thread(Base):
     
     title = Column(String)
     is_vegan = Column(Boolean)
-    parent_id = Column(Integer, ForeignKey('topics.id'))
+    parent_id = Column(Integer, ForeignKey('topics.id', ondelete='CASCADE'), index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    num_posts = Column(Integer, nullable=False, default=0, server_default='0')
+    last_post_id = Column(Integer)
+    last_post_at = Column(DateTime)
+    last_post_user_id = Column(Integer)
 
-    parent = relationship('Topic', backref='children_threads')
+    parent = relationship('Topic', backref=backref('children_threads', passive_deletes=True))
     user = relationship('User')
     
     def __repr__(self):
@@ -58,13 +310,17 @@ class Thread(Base):
 
 class Post(Base):
     __tablename__ = 'posts'
+    __table_args__ = (
+        Index('ix_posts_parent_id_id', 'parent_id', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     text = Column(String)
-    parent_id = Column(Integer, ForeignKey('threads.id'))
+    parent_id = Column(Integer, ForeignKey('threads.id', ondelete='CASCADE'))
+    created_at = Column(DateTime, default=datetime.now)
 
-    parent = relationship('Thread', backref='children_posts')
+    parent = relationship('Thread', backref=backref('children_posts', passive_deletes=True))
     user = relationship('User', backref='posts')
 
     def __repr__(self):
@@ -78,8 +334,16 @@ class User(Base):
     name = Column(String, nullable=False, unique=True)
     password_hash = Column(String, nullable=False)
     password_salt = Column(String, nullable=False)
-    token = Column(String, index=True)
+    token = Column(String)
+    token_hash = Column(String, index=True)
     token_expires_at = Column(DateTime)
+    token_generation = Column(Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'user [id: {self.id}, name: {self.name}]'
+
+
+schema_version = Table(
+    'schema_version', Base.metadata,
+    Column('version', Integer, nullable=False)
+)
@@ -1,134 +1,311 @@
-from typing import Optional, Literal
-from db_definitions import Topic, Thread, Post, User, Base, DBSession
+from typing import Optional, Literal, Tuple, List, Iterator, Iterable, Dict
+from db_definitions import Topic, Thread, Post, User, DBSession, engine, use_primary, begin_snapshot
 import schema
-from humps import camelize
+import read_models
 from datetime import datetime, timedelta
+from collections import Counter
 import os
 
-from utils import make_password, make_token
+from utils import make_token
+from token_cache import token_cache, hash_token, CachedUser, TOKEN_CACHE_URL
+from response_cache import response_cache
+from signed_tokens import SIGNED_TOKENS, TokenClaims, make_signed_token, read_signed_token, check_token_settings
+from search import index_rows, unindex_rows, find, snippets
+from migrations import check_schema
+from events import broker
 
-from sqlalchemy.orm import Session
+from sqlalchemy import func, literal, event, select, insert, delete, union_all
+from sqlalchemy.sql.expression import CTE
+from sqlalchemy.orm import Session, Query, aliased
 
-ROOT_PASSWORD = os.environ['ROOT_PASSWORD'] if 'ROOT_PASSWORD' in os.environ else 'toor'
+THREAD_PAGE_SIZE = int(os.environ['THREAD_PAGE_SIZE']) if 'THREAD_PAGE_SIZE' in os.environ else 50
+THREAD_MAX_PAGE_SIZE = int(os.environ['THREAD_MAX_PAGE_SIZE']) if 'THREAD_MAX_PAGE_SIZE' in os.environ else 500
+POST_BATCH_MAX_SIZE = int(os.environ['POST_BATCH_MAX_SIZE']) if 'POST_BATCH_MAX_SIZE' in os.environ else 1000
+READ_BATCH_MAX_SIZE = int(os.environ['READ_BATCH_MAX_SIZE']) if 'READ_BATCH_MAX_SIZE' in os.environ else 50
+STREAM_CHUNK_ROWS = int(os.environ['STREAM_CHUNK_ROWS']) if 'STREAM_CHUNK_ROWS' in os.environ else 500
 
 
 def init_db():
-    session = DBSession()
-    engine = session.get_bind()
-    Base.metadata.create_all(engine)
-    root_exists = session.query(User).filter(User.id == 0).count()
-    if not root_exists:
-        hash, salt = make_password(ROOT_PASSWORD)
-        root_user = User(
-            id=0,
-            name='root',
-            password_hash=hash,
-            password_salt=salt
-        )
-        session.add(root_user)
-    home_exists = session.query(Topic).filter(Topic.id == 0).count()
-    if not home_exists:
-        home_topic = Topic(
-            id=0,
-            title='Home',
-            user_id=0
-        )
-        session.add(home_topic)
-    session.commit()
+    check_schema(engine)
+    if SIGNED_TOKENS:
+        check_token_settings(TOKEN_CACHE_URL)
+        session = DBSession()
+        use_primary(session)
+        try:
+            load_token_generations(session)
+        finally:
+            session.close()
+
+
+def get_topic_header(session: Session, id: int) -> Optional[read_models.ReadModel]:
+    topic = session.query(Topic.title, User.id, User.name)\
+        .outerjoin(User, Topic.user_id == User.id)\
+        .filter(Topic.id == id)\
+        .first()
+    if topic is None:
+        return None
+    title, user_id, user_name = topic
+    return read_models.topic(
+        title=title,
+        topics=[],
+        threads=[],
+        owner=read_models.user(user_id, user_name),
+        path=get_topic_path(session, id)
+    )
 
 
-def get_topic(session: Session, id: int) -> Optional[schema.Topic]:
-    topic = session.query(Topic).get(id)
+def get_topic(session: Session, id: int) -> Optional[read_models.ReadModel]:
+    topic = get_topic_header(session, id)
     if topic is None:
         return None
-    path = get_topic_path(topic)
-    title = topic.title
-    topics = (
-        schema.TopicData(
-            **camelize(
-                schema.DBTopic.from_orm(sub_topic).dict()
-            ),
-            link=sub_topic.id,
-            numTopics=len(sub_topic.children_topics),
-            numThreads=len(sub_topic.children_threads),
-            user=schema.User.from_orm(sub_topic.user)
+    topic['topics'] = [
+        read_models.topic_data(*row)
+        for row in get_sub_topics(session, id)
+    ]
+    topic['threads'] = [
+        read_models.thread_data(*row)
+        for row in get_sub_threads(session, id)
+    ]
+    return topic
+
+
+def get_topic_snapshot(session: Session, id: int) -> Optional[Tuple[int, read_models.ReadModel]]:
+    begin_snapshot(session)
+    version = get_topic_version(session, id)
+    if version is None:
+        return None
+    return version, get_topic_header(session, id)
+
+
+def stream_topic(session: Session, id: int, topic: read_models.ReadModel) -> Iterator[bytes]:
+    try:
+        head, middle, tail = read_models.split_template(
+            read_models.topic_response(topic), 'topics', 'threads'
         )
-        for sub_topic in topic.children_topics
-    )
-    threads = (
-        schema.ThreadData(
-            **camelize(
-                schema.DBThread.from_orm(sub_thread).dict()
-            ),
-            link=sub_thread.id,
-            numPosts=len(sub_thread.children_posts),
-            user=schema.User.from_orm(sub_thread.user)
+        yield head
+        yield from read_models.stream_array(
+            read_models.topic_data, stream_rows(get_sub_topics(session, id)), STREAM_CHUNK_ROWS
         )
-        for sub_thread in topic.children_threads
-    )
-    return schema.Topic(
-        title=title,
-        path=path,
-        topics=topics,
-        threads=threads,
-        user=schema.User.from_orm(topic.user)
-    )
+        yield middle
+        yield from read_models.stream_array(
+            read_models.thread_data, stream_rows(get_sub_threads(session, id)), STREAM_CHUNK_ROWS
+        )
+        yield tail
+    finally:
+        session.close()
+
+
+def stream_rows(query: Query) -> Query:
+    return query.execution_options(stream_results=True).yield_per(STREAM_CHUNK_ROWS)
+
+
+def get_sub_topics(session: Session, topic_id: int) -> Query:
+    return sub_topics_query(session, Topic.parent_id == topic_id)
+
+
+def sub_topics_query(session: Session, condition) -> Query:
+    return session.query(
+        Topic.title,
+        Topic.id,
+        Topic.num_topics,
+        Topic.num_threads,
+        Topic.last_post_at,
+        User.id,
+        User.name
+    )\
+        .outerjoin(User, Topic.user_id == User.id)\
+        .filter(condition)\
+        .order_by(Topic.id)
+
+
+def get_sub_threads(session: Session, topic_id: int) -> Query:
+    return sub_threads_query(session, Thread.parent_id == topic_id)
+
 
+def sub_threads_query(session: Session, condition) -> Query:
+    return session.query(
+        Thread.title,
+        Thread.id,
+        Thread.num_posts,
+        Thread.last_post_at,
+        Thread.is_vegan,
+        User.id,
+        User.name
+    )\
+        .outerjoin(User, Thread.user_id == User.id)\
+        .filter(condition)\
+        .order_by(Thread.id)
 
-def get_thread(session: Session, id: int) -> Optional[schema.Thread]:
-    thread = session.query(Thread).get(id)
+
+def get_thread_header(session: Session, id: int) -> Optional[read_models.ReadModel]:
+    thread = session.query(Thread.title, Thread.parent_id)\
+        .filter(Thread.id == id)\
+        .first()
     if thread is None:
         return None
-    title = thread.title
-    path = get_thread_path(thread)
-    posts = (
-        schema.PostData(
-            **camelize(
-                schema.DBPost.from_orm(post).dict()
-            ),
-            user=schema.User.from_orm(post.user)
-        )
-        for post in thread.children_posts
-    )
-    return schema.Thread(
+    title, parent_id = thread
+    return read_models.thread(
         title=title,
-        path=path,
-        posts=posts
+        posts=[],
+        path=get_thread_path(session, parent_id)
     )
 
 
-def get_thread_posts(session, id):
-    thread = get_thread(session, id)
-    return thread.children_posts if thread is not None else None
-
+def get_thread(
+        session: Session, id: int,
+        cursor: Optional[int] = None, limit: int = THREAD_PAGE_SIZE
+) -> Optional[Tuple[read_models.ReadModel, Optional[int]]]:
+    thread = get_thread_header(session, id)
+    if thread is None:
+        return None
+    page = get_thread_posts_query(session, id, cursor).limit(limit + 1).all()
+    next_cursor = page[limit - 1][0] if len(page) > limit else None
+    thread['posts'] = [
+        read_models.post_data(*row)
+        for row in page[:limit]
+    ]
+    return thread, next_cursor
 
-def get_topic_path(topic: Topic) -> schema.Path:
-    path = [topic]
 
-    def recur_add_parent(topic):
-        nonlocal path
-        parent = topic.parent
-        if parent is not None:
-            path.append(parent)
-            recur_add_parent(parent)
-    recur_add_parent(topic)
-    return [
-        schema.PathElement(
-            id=topic.id,
-            title=topic.title
+def get_thread_snapshot(
+        session: Session, id: int, cursor: Optional[int], limit: Optional[int]
+) -> Optional[Tuple[int, read_models.ReadModel, Optional[int]]]:
+    begin_snapshot(session)
+    version = get_thread_version(session, id)
+    if version is None:
+        return None
+    thread = get_thread_header(session, id)
+    next_cursor = None
+    if limit is not None:
+        page_end = get_thread_posts_query(session, id, cursor).with_entities(Post.id)\
+            .offset(limit - 1).limit(2).all()
+        next_cursor = page_end[0][0] if len(page_end) > 1 else None
+    return version, thread, next_cursor
+
+
+def stream_thread(
+        session: Session, id: int, cursor: Optional[int], limit: Optional[int],
+        thread: read_models.ReadModel, next_cursor: Optional[int]
+) -> Iterator[bytes]:
+    try:
+        head, tail = read_models.split_template(
+            read_models.thread_response(thread, next_cursor), 'posts'
         )
-        for topic in reversed(path)
-    ]
+        query = get_thread_posts_query(session, id, cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        yield head
+        yield from read_models.stream_array(read_models.post_data, stream_rows(query), STREAM_CHUNK_ROWS)
+        yield tail
+    finally:
+        session.close()
+
+
+def get_thread_posts_query(session: Session, thread_id: int, cursor: Optional[int]) -> Query:
+    query = session.query(Post.id, Post.text, User.id, User.name)\
+        .outerjoin(User, Post.user_id == User.id)\
+        .filter(Post.parent_id == thread_id)
+    if cursor is not None:
+        query = query.filter(Post.id > cursor)
+    return query.order_by(Post.id)
+
+
+def get_topic_path(session: Session, topic_id: int) -> List[read_models.ReadModel]:
+    return get_topic_paths(session, [topic_id])[topic_id]
+
+
+def get_topic_paths(session: Session, topic_ids: Iterable[int]) -> Dict[int, List[read_models.ReadModel]]:
+    paths = {topic_id: [] for topic_id in topic_ids}
+    if not paths:
+        return paths
+    ancestors = session.query(
+        Topic.id.label('origin'), Topic.id, Topic.title, Topic.parent_id, literal(0).label('depth')
+    )\
+        .filter(Topic.id.in_(paths))\
+        .cte('ancestors', recursive=True)
+    parent = aliased(Topic)
+    ancestors = ancestors.union_all(
+        session.query(
+            ancestors.c.origin, parent.id, parent.title, parent.parent_id, ancestors.c.depth + 1
+        )
+        .filter(parent.id == ancestors.c.parent_id)
+    )
+    rows = session.query(ancestors.c.origin, ancestors.c.id, ancestors.c.title)\
+        .order_by(ancestors.c.origin, ancestors.c.depth.desc())
+    for origin, id, title in rows:
+        paths[origin].append(read_models.path_element(id, title))
+    return paths
 
 
-def get_thread_path(thread):
-    parent = thread.parent
-    if parent is not None:
-        return get_topic_path(parent)
+def get_thread_path(session: Session, parent_id: Optional[int]) -> List[read_models.ReadModel]:
+    if parent_id is not None:
+        return get_topic_path(session, parent_id)
     else:
         return []
 
 
+def get_topics(session: Session, ids: List[int]) -> Dict[int, Tuple[int, read_models.ReadModel]]:
+    headers = session.query(Topic.id, Topic.version, Topic.title, User.id, User.name)\
+        .outerjoin(User, Topic.user_id == User.id)\
+        .filter(Topic.id.in_(ids))\
+        .all()
+    if not headers:
+        return {}
+    paths = get_topic_paths(session, [row[0] for row in headers])
+    topics = {
+        id: (version, read_models.topic(
+            title=title,
+            topics=[],
+            threads=[],
+            owner=read_models.user(user_id, user_name),
+            path=paths[id]
+        ))
+        for id, version, title, user_id, user_name in headers
+    }
+    for *row, parent_id in sub_topics_query(session, Topic.parent_id.in_(topics)).add_columns(Topic.parent_id):
+        topics[parent_id][1]['topics'].append(read_models.topic_data(*row))
+    for *row, parent_id in sub_threads_query(session, Thread.parent_id.in_(topics)).add_columns(Thread.parent_id):
+        topics[parent_id][1]['threads'].append(read_models.thread_data(*row))
+    return topics
+
+
+ThreadPage = Tuple[int, Optional[int], int]
+
+
+def get_threads(
+        session: Session, pages: List[ThreadPage]
+) -> Dict[ThreadPage, Tuple[int, read_models.ReadModel, Optional[int]]]:
+    headers = session.query(Thread.id, Thread.version, Thread.title, Thread.parent_id)\
+        .filter(Thread.id.in_({id for id, _, _ in pages}))\
+        .all()
+    if not headers:
+        return {}
+    paths = get_topic_paths(session, {parent_id for _, _, _, parent_id in headers if parent_id is not None})
+    found = {
+        id: (version, title, paths[parent_id] if parent_id is not None else [])
+        for id, version, title, parent_id in headers
+    }
+    pages = [page for page in dict.fromkeys(pages) if page[0] in found]
+    branches = []
+    for index, (id, cursor, limit) in enumerate(pages):
+        posts = get_thread_posts_query(session, id, cursor).limit(limit + 1).subquery()
+        branches.append(select(literal(index).label('page'), *posts.c))
+    rows: Dict[int, List[tuple]] = {index: [] for index in range(len(pages))}
+    for index, *row in session.execute(union_all(*branches).order_by('page', 'id')):
+        rows[index].append(row)
+    threads = {}
+    for index, (id, cursor, limit) in enumerate(pages):
+        version, title, path = found[id]
+        page = rows[index]
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        threads[(id, cursor, limit)] = version, read_models.thread(
+            title=title,
+            posts=[read_models.post_data(*row) for row in page[:limit]],
+            path=path
+        ), next_cursor
+    return threads
+
+
 # def get_user_by_id(session: Session, id: int) -> Optional[schema.User]:
 #     user = session.query(User).get(id)
 #     if user is None:
@@ -137,51 +314,134 @@ def get_thread_path(thread):
 #     return schema.User(**db_user.dict())
 
 
-def get_user_by_name(session: Session, username: str) -> schema.DBUser:
-    user = session.query(User).filter(User.name == username).one()
-    db_user = schema.DBUser.from_orm(user)
-    return db_user
+def search(
+        session: Session, model: Literal[Post, Thread], query: str,
+        topic_id: Optional[int], offset: int, limit: int
+) -> Tuple[List[read_models.ReadModel], Optional[int]]:
+    scope = None
+    if topic_id is not None:
+        thread_scope = Thread.parent_id.in_(select(topic_subtree(topic_id).c.id))
+        scope = thread_scope if model is Thread else Post.parent_id.in_(
+            select(Thread.id).where(thread_scope)
+        )
+    ids = find(session, model, query, scope, offset, limit + 1)
+    next_offset = offset + limit if len(ids) > limit else None
+    ids = ids[:limit]
+    if not ids:
+        return [], next_offset
+    found = snippets(session, model, query, ids)
+    if model is Post:
+        rows = session.query(Post.id, Post.parent_id, Thread.title, User.id, User.name)\
+            .join(Thread, Thread.id == Post.parent_id)\
+            .outerjoin(User, User.id == Post.user_id)\
+            .filter(Post.id.in_(ids))
+        found_rows = {
+            post_id: read_models.search_result(thread_id, title, post_id, found.get(post_id), user_id, user_name)
+            for post_id, thread_id, title, user_id, user_name in rows
+        }
+    else:
+        rows = session.query(Thread.id, Thread.title, User.id, User.name)\
+            .outerjoin(User, User.id == Thread.user_id)\
+            .filter(Thread.id.in_(ids))
+        found_rows = {
+            thread_id: read_models.search_result(thread_id, title, None, found.get(thread_id), user_id, user_name)
+            for thread_id, title, user_id, user_name in rows
+        }
+    return [found_rows[id] for id in ids if id in found_rows], next_offset
+
+
+def get_user_by_name(session: Session, username: str) -> Optional[schema.DBUser]:
+    user = session.query(User).filter(User.name == username).first()
+    if user is None:
+        return None
+    return schema.DBUser.from_orm(user)
 
 
 def get_user_by_token(session: Session, token: str) -> Optional[schema.User]:
-    users = session.query(User).filter(User.token == token).all()
-    if len(users) != 1:
+    if SIGNED_TOKENS:
+        return get_user_by_signed_token(token)
+    key = hash_token(token)
+    cached = token_cache.get(key)
+    if cached is None:
+        users = session.query(User.id, User.name, User.token_expires_at)\
+            .filter(User.token_hash == key)\
+            .all()
+        if len(users) != 1:
+            return None
+        cached = CachedUser(*users[0])
+        if cached.expires_at is None:
+            return None
+        token_cache.set(key, cached)
+    if datetime.now() > cached.expires_at:
         return None
-    user = users[0]
-    db_user = schema.DBUser.from_orm(user)
-    if datetime.now() > db_user.token_expires_at:
+    return schema.User(id=cached.user_id, name=cached.name)
+
+
+def get_user_by_signed_token(token: str) -> Optional[schema.User]:
+    claims = read_signed_token(token)
+    if claims is None or datetime.now() > claims.expires_at:
         return None
-    return schema.User(**db_user.dict())
+    generation = token_cache.get_generation(claims.user_id)
+    if generation is not None and claims.generation < generation:
+        return None
+    return schema.User(id=claims.user_id, name=claims.name)
 
 
-def set_user_token(session: Session, username: str) -> str:
-    token = make_token()
+def load_token_generations(session: Session):
+    users = session.query(User.id, User.token_generation)\
+        .filter(User.token_generation > 0)\
+        .all()
+    for user_id, generation in users:
+        token_cache.set_generation(user_id, generation)
+
+
+def set_user_token(session: Session, user: schema.DBUser) -> str:
     expires_at = datetime.now() + timedelta(days=1)
-    session.query(User).filter(User.name == username)\
+    if SIGNED_TOKENS:
+        return make_signed_token(TokenClaims(user.id, user.name, user.token_generation, expires_at))
+    token = make_token()
+    session.query(User).filter(User.id == user.id)\
         .update({
-            User.token: token,
+            User.token_hash: hash_token(token),
             User.token_expires_at: expires_at
         })
     session.commit()
+    token_cache.delete_user(user.id)
     return token
 
 
-def add_user(session: Session, username: str, password: str):
-    hash, salt = make_password(password)
+def add_user(session: Session, username: str, password_hash: str, password_salt: str):
     user = User(
         name=username,
-        password_hash=hash,
-        password_salt=salt
+        password_hash=password_hash,
+        password_salt=password_salt
     )
     session.add(user)
     session.commit()
 
 
-def change_user_password(session: Session, user_id: int, password: str):
+def change_user_password(
+        session: Session, user_id: int,
+        password_hash: str, password_salt: str
+):
     user: User = session.query(User).get(user_id)
-    hash, salt = make_password(password)
-    user.password_hash = hash
-    user.password_salt = salt
+    user.password_hash = password_hash
+    user.password_salt = password_salt
+    user.token_generation += 1
+    session.commit()
+    token_cache.delete_user(user_id)
+    token_cache.set_generation(user_id, user.token_generation)
+
+
+def update_user_password_hash(
+        session: Session, user_id: int,
+        password_hash: str, password_salt: str
+):
+    session.query(User).filter(User.id == user_id)\
+        .update({
+            User.password_hash: password_hash,
+            User.password_salt: password_salt
+        })
     session.commit()
 
 
@@ -190,92 +450,417 @@ def user_exists(session: Session, username: str):
     return count == 1
 
 
-def thread_exists(session: Session, thread_id: int):
-    count = session.query(Thread).filter(Thread.id == thread_id).count()
-    return count == 1
+def insert_child(
+        session: Session, table: Literal[Post, Thread, Topic], values: dict,
+        parent_table: Literal[Thread, Topic], parent_id: int
+) -> Optional[int]:
+    columns = table.__table__.c
+    statement = insert(table).from_select(
+        [*values, 'parent_id'],
+        select(
+            *(literal(value, columns[name].type) for name, value in values.items()),
+            parent_table.id
+        ).where(parent_table.id == parent_id)
+    )
+    if session.get_bind().dialect.implicit_returning:
+        return session.execute(statement.returning(table.id)).scalar()
+    result = session.execute(statement)
+    return result.lastrowid if result.rowcount == 1 else None
 
 
-def add_post(session: Session, thread_id: int, user: schema.User, text: str):
-    post = Post(
-        user_id=user.id,
-        text=text,
-        parent_id=thread_id
+def topic_parent(session: Session, topic_id: Optional[int]) -> Optional[int]:
+    if topic_id is None:
+        return None
+    return session.query(Topic.parent_id).filter(Topic.id == topic_id).scalar()
+
+
+def thread_parents(session: Session, thread_id: int) -> Tuple[Optional[int], Optional[int]]:
+    parent = aliased(Topic)
+    return session.query(Thread.parent_id, parent.parent_id)\
+        .outerjoin(parent, parent.id == Thread.parent_id)\
+        .filter(Thread.id == thread_id)\
+        .one()
+
+
+def add_post(session: Session, thread_id: int, user: schema.User, text: str) -> bool:
+    created_at = datetime.now()
+    post_id = insert_child(session, Post, {
+        'user_id': user.id,
+        'text': text,
+        'created_at': created_at
+    }, Thread, thread_id)
+    if post_id is None:
+        session.rollback()
+        return False
+    index_rows(session, Post, Post.id == post_id)
+    topic_id, parent_topic_id = thread_parents(session, thread_id)
+    last_post = last_post_values((post_id, created_at, user.id))
+    change_counters(session, Thread, thread_id, {'num_posts': 1}, last_post)
+    change_counters(session, Topic, topic_id, {'num_posts': 1}, last_post)
+    bump_versions(session, Topic, [parent_topic_id])
+    queue_event(
+        session, [('thread', thread_id), ('topic', topic_id)],
+        read_models.post_added(thread_id, read_models.post_data(post_id, text, user.id, user.name))
     )
-    session.add(post)
     session.commit()
+    return True
+
+
+def insert_posts(session: Session, rows: List[dict]) -> List[int]:
+    if session.get_bind().dialect.name == 'postgresql':
+        post_ids = list(session.execute(
+            select(func.nextval(func.pg_get_serial_sequence(Post.__tablename__, 'id')))
+                .select_from(func.generate_series(1, len(rows)))
+        ).scalars())
+        session.execute(insert(Post), [{**row, 'id': post_id} for row, post_id in zip(rows, post_ids)])
+        return post_ids
+    return [session.execute(insert(Post).values(row)).inserted_primary_key[0] for row in rows]
+
+
+def add_posts(
+        session: Session, posts: List[Tuple[int, int, str]], require_all: bool = True
+) -> List[bool]:
+    parent = aliased(Topic)
+    thread_ids = {thread_id for thread_id, _, _ in posts}
+    parents = {
+        thread_id: (topic_id, parent_topic_id)
+        for thread_id, topic_id, parent_topic_id in session.query(
+            Thread.id, Thread.parent_id, parent.parent_id
+        )
+            .outerjoin(parent, parent.id == Thread.parent_id)
+            .filter(Thread.id.in_(thread_ids))
+    }
+    accepted = [thread_id in parents for thread_id, _, _ in posts]
+    if not any(accepted) or require_all and not all(accepted):
+        session.rollback()
+        return accepted
+    created_at = datetime.now()
+    rows = [
+        {'user_id': user_id, 'text': text, 'parent_id': thread_id, 'created_at': created_at}
+        for thread_id, user_id, text in posts
+        if thread_id in parents
+    ]
+    post_ids = insert_posts(session, rows)
+    index_rows(session, Post, Post.id.in_(post_ids))
+    last_posts = {}
+    for post_id, row in zip(post_ids, rows):
+        last_posts[row['parent_id']] = max(post_id, last_posts.get(row['parent_id'], post_id))
+    authors = {post_id: row['user_id'] for post_id, row in zip(post_ids, rows)}
+    thread_counts = Counter(row['parent_id'] for row in rows)
+    topic_counts = Counter()
+    topic_last_posts = {}
+    for thread_id, post_id in sorted(last_posts.items(), key=lambda item: item[1]):
+        topic_id, _ = parents[thread_id]
+        last_post = last_post_values((post_id, created_at, authors[post_id]))
+        change_counters(session, Thread, thread_id, {'num_posts': thread_counts[thread_id]}, last_post)
+        topic_counts[topic_id] += thread_counts[thread_id]
+        topic_last_posts[topic_id] = last_post
+    for topic_id, count in topic_counts.items():
+        change_counters(session, Topic, topic_id, {'num_posts': count}, topic_last_posts[topic_id])
+    bump_versions(session, Topic, list({parent_topic_id for _, parent_topic_id in parents.values()}))
+    channels = {
+        thread_id: [('thread', thread_id), ('topic', topic_id)]
+        for thread_id, (topic_id, _) in parents.items()
+    }
+    if any(broker.wants(channel) for channel_list in channels.values() for channel in channel_list):
+        new_posts = session.query(Post.parent_id, Post.id, Post.text, User.id, User.name)\
+            .outerjoin(User, User.id == Post.user_id)\
+            .filter(Post.id.in_(post_ids))\
+            .order_by(Post.id)
+        for thread_id, *post in new_posts:
+            queue_event(session, channels[thread_id], read_models.post_added(thread_id, read_models.post_data(*post)))
+    session.commit()
+    return accepted
+
+
+def change_counters(
+        session: Session, table: Literal[Thread, Topic], id: Optional[int],
+        deltas: dict, values: Optional[dict] = None
+):
+    if id is None:
+        return
+    changes = {table.version: table.version + 1}
+    for name, delta in deltas.items():
+        changes[getattr(table, name)] = getattr(table, name) + delta
+    for name, value in (values or {}).items():
+        changes[getattr(table, name)] = value
+    session.query(table).filter(table.id == id)\
+        .update(changes, synchronize_session=False)
+    queue_invalidation(session, table, [id])
+
+
+def refresh_thread_last_post(session: Session, thread_id: int):
+    last_post = session.query(Post.id, Post.created_at, Post.user_id)\
+        .filter(Post.parent_id == thread_id)\
+        .order_by(Post.id.desc())\
+        .first()
+    change_counters(session, Thread, thread_id, {}, last_post_values(last_post))
+
+
+def refresh_topic_last_post(session: Session, topic_id: Optional[int]):
+    last_post = session.query(Thread.last_post_id, Thread.last_post_at, Thread.last_post_user_id)\
+        .filter(Thread.parent_id == topic_id, Thread.last_post_id.isnot(None))\
+        .order_by(Thread.last_post_id.desc())\
+        .first()
+    change_counters(session, Topic, topic_id, {}, last_post_values(last_post))
+
+
+def last_post_values(last_post: Optional[tuple]) -> dict:
+    post_id, created_at, user_id = last_post if last_post is not None else (None, None, None)
+    return {
+        'last_post_id': post_id,
+        'last_post_at': created_at,
+        'last_post_user_id': user_id
+    }
+
+
+def repair_counters(session: Session):
+    child_topic = aliased(Topic)
+    last_post = aliased(Post)
+    thread_posts = session.query(Post).filter(Post.parent_id == Thread.id)
+    session.query(Thread).update({
+        Thread.num_posts: thread_posts.with_entities(func.count()).scalar_subquery(),
+        Thread.last_post_id: thread_posts.with_entities(func.max(Post.id)).scalar_subquery()
+    }, synchronize_session=False)
+    session.query(Thread).update({
+        Thread.last_post_at: session.query(last_post.created_at)
+            .filter(last_post.id == Thread.last_post_id).scalar_subquery(),
+        Thread.last_post_user_id: session.query(last_post.user_id)
+            .filter(last_post.id == Thread.last_post_id).scalar_subquery()
+    }, synchronize_session=False)
+    topic_threads = session.query(Thread).filter(Thread.parent_id == Topic.id)
+    session.query(Topic).update({
+        Topic.num_topics: session.query(func.count())
+            .filter(child_topic.parent_id == Topic.id).scalar_subquery(),
+        Topic.num_threads: topic_threads.with_entities(func.count()).scalar_subquery(),
+        Topic.num_posts: topic_threads.with_entities(
+            func.coalesce(func.sum(Thread.num_posts), 0)
+        ).scalar_subquery(),
+        Topic.last_post_id: topic_threads.with_entities(func.max(Thread.last_post_id)).scalar_subquery()
+    }, synchronize_session=False)
+    session.query(Topic).update({
+        Topic.last_post_at: session.query(last_post.created_at)
+            .filter(last_post.id == Topic.last_post_id).scalar_subquery(),
+        Topic.last_post_user_id: session.query(last_post.user_id)
+            .filter(last_post.id == Topic.last_post_id).scalar_subquery()
+    }, synchronize_session=False)
+    session.commit()
+
+
+def get_versions(session: Session, table: Literal[Thread, Topic], ids: Iterable[int]) -> Dict[int, int]:
+    rows = session.execute(
+        select(table.id, table.version).where(table.id.in_(ids))
+    )
+    return dict(rows.all())
+
+
+def get_topic_version(session: Session, topic_id: int) -> Optional[int]:
+    return get_versions(session, Topic, [topic_id]).get(topic_id)
 
 
-DB_SCHEMA = {
-    Post: schema.DBPost,
-    Thread: schema.DBThread,
-    Topic: schema.DBTopic
+def get_thread_version(session: Session, thread_id: int) -> Optional[int]:
+    return get_versions(session, Thread, [thread_id]).get(thread_id)
+
+
+CACHE_GROUPS = {
+    Thread: 'thread',
+    Topic: 'topic'
 }
 
 
-def row_belongs_to_user(
-        session: Session, row_id: int,
-        user_id: int, table: Literal[Post, Thread, Topic]
-):
-    row: Optional[table] = session.query(table).get(row_id)
-    if row is None:
-        return False
-    db_row = DB_SCHEMA[table].from_orm(row)
-    return db_row.user_id == user_id
+def bump_versions(session: Session, table: Literal[Thread, Topic], ids: List[Optional[int]]):
+    ids = [id for id in ids if id is not None]
+    if ids:
+        session.query(table).filter(table.id.in_(ids))\
+            .update({table.version: table.version + 1}, synchronize_session=False)
+        queue_invalidation(session, table, ids)
 
 
-def remove_row(session: Session, row_id: int, table: Literal[Post, Thread, Topic]):
-    row = session.query(table).get(row_id)
-    session.delete(row)
-    session.commit()
+def queue_invalidation(session: Session, table: Literal[Thread, Topic], ids: List[int]):
+    session.info.setdefault('invalidate', set()).update(
+        (CACHE_GROUPS[table], id) for id in ids
+    )
 
 
-def post_belongs_to_user(session: Session, post_id: int, user_id: int) -> bool:
-    return row_belongs_to_user(session, post_id, user_id, Post)
+@event.listens_for(Session, 'after_commit')
+def invalidate_cached_responses(session: Session):
+    for group in session.info.pop('invalidate', ()):
+        response_cache.invalidate(group)
 
 
-def remove_post(session: Session, post_id: int):
-    post = session.query(Post).get(post_id)
-    session.delete(post)
-    session.commit()
+@event.listens_for(Session, 'after_rollback')
+def discard_invalidations(session: Session):
+    session.info.pop('invalidate', None)
 
 
-def topic_exists(session: Session, topic_id: int) -> bool:
-    count = session.query(Topic).filter(Topic.id == topic_id).count()
-    return count == 1
+def queue_event(session: Session, channels: List[Tuple[str, Optional[int]]], data: read_models.ReadModel):
+    for channel in channels:
+        if channel[1] is not None and broker.wants(channel):
+            session.info.setdefault('events', []).append((channel, data))
 
 
-def add_topic(session: Session, title: str, parent_id: int, user_id: int):
-    topic = Topic(
-        title=title,
-        parent_id=parent_id,
-        user_id=user_id
+@event.listens_for(Session, 'after_commit')
+def publish_events(session: Session):
+    for channel, data in session.info.pop('events', ()):
+        broker.publish(channel, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_events(session: Session):
+    session.info.pop('events', None)
+
+
+def remove_post(session: Session, post_id: int, user_id: int) -> bool:
+    condition = (Post.id == post_id) & (Post.user_id == user_id)
+    unindex_rows(session, Post, condition)
+    row = delete_returning(
+        session, Post, condition,
+        Post.parent_id,
+        select(Thread.parent_id).where(Thread.id == Post.parent_id).scalar_subquery(),
+        select(Topic.parent_id).join(Thread, Thread.parent_id == Topic.id)
+            .where(Thread.id == Post.parent_id).scalar_subquery()
+    )
+    if row is None:
+        session.rollback()
+        return False
+    thread_id, topic_id, parent_topic_id = row
+    change_counters(session, Thread, thread_id, {'num_posts': -1})
+    change_counters(session, Topic, topic_id, {'num_posts': -1})
+    refresh_thread_last_post(session, thread_id)
+    refresh_topic_last_post(session, topic_id)
+    bump_versions(session, Topic, [parent_topic_id])
+    queue_event(
+        session, [('thread', thread_id), ('topic', topic_id)],
+        read_models.post_removed(thread_id, post_id)
     )
-    session.add(topic)
     session.commit()
+    return True
 
 
-def add_thread(session: Session, title: str, is_vegan: bool, parent_id: int, user_id: int):
-    thread = Thread(
-        title=title,
-        is_vegan=is_vegan,
-        parent_id=parent_id,
-        user_id=user_id
-    )
-    session.add(thread)
+def add_topic(session: Session, title: str, parent_id: int, user_id: int) -> bool:
+    topic_id = insert_child(session, Topic, {
+        'title': title,
+        'user_id': user_id
+    }, Topic, parent_id)
+    if topic_id is None:
+        session.rollback()
+        return False
+    change_counters(session, Topic, parent_id, {'num_topics': 1})
+    bump_versions(session, Topic, [topic_parent(session, parent_id)])
     session.commit()
+    return True
 
 
-def remove_topic(session: Session, topic_id: int):
-    remove_row(session, topic_id, Topic)
+def add_thread(session: Session, title: str, is_vegan: bool, parent_id: int, user_id: int) -> bool:
+    thread_id = insert_child(session, Thread, {
+        'title': title,
+        'is_vegan': is_vegan,
+        'user_id': user_id
+    }, Topic, parent_id)
+    if thread_id is None:
+        session.rollback()
+        return False
+    index_rows(session, Thread, Thread.id == thread_id)
+    change_counters(session, Topic, parent_id, {'num_threads': 1})
+    bump_versions(session, Topic, [topic_parent(session, parent_id)])
+    session.commit()
+    return True
 
 
-def remove_thread(session: Session, thread_id: int):
-    remove_row(session, thread_id, Thread)
+def topic_subtree(topic_id: int, user_id: Optional[int] = None) -> CTE:
+    root = select(Topic.id).where(Topic.id == topic_id)
+    if user_id is not None:
+        root = root.where(Topic.user_id == user_id)
+    subtree = root.cte('subtree', recursive=True)
+    child = aliased(Topic)
+    return subtree.union_all(
+        select(child.id).where(child.parent_id == subtree.c.id)
+    )
 
 
-def thread_belongs_to_user(session: Session, thread_id: int, user_id: int):
-    return row_belongs_to_user(session, thread_id, user_id, Thread)
+def delete_rows(session: Session, table: Literal[Post, Thread, Topic], condition) -> int:
+    result = session.execute(
+        delete(table)
+        .where(condition)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def delete_returning(session: Session, table: Literal[Post, Thread, Topic], condition, *columns) -> Optional[tuple]:
+    if session.get_bind().dialect.full_returning:
+        return session.execute(
+            delete(table)
+            .where(condition)
+            .returning(*columns)
+            .execution_options(synchronize_session=False)
+        ).first()
+    row = session.execute(select(*columns).where(condition)).first()
+    if row is None or not delete_rows(session, table, condition):
+        return None
+    return row
+
 
+def topic_parent_column(column):
+    parent = aliased(Topic)
+    return select(parent.parent_id).where(parent.id == column).scalar_subquery()
 
-def topic_belongs_to_user(session: Session, topic_id: int, user_id: int):
-    return row_belongs_to_user(session, topic_id, user_id, Topic)
+
+def remove_topic(session: Session, topic_id: int, user_id: int) -> bool:
+    topic_ids = select(topic_subtree(topic_id, user_id).c.id)
+    thread_ids = select(Thread.id).where(Thread.parent_id.in_(topic_ids))
+    removed_topics = session.execute(topic_ids).scalars().all()
+    if not removed_topics:
+        return False
+    removed_threads = session.execute(thread_ids).scalars().all()
+    queue_invalidation(session, Topic, removed_topics)
+    queue_invalidation(session, Thread, removed_threads)
+    queue_event(
+        session,
+        [('topic', id) for id in removed_topics] + [('thread', id) for id in removed_threads],
+        read_models.closed()
+    )
+    unindex_rows(session, Post, Post.parent_id.in_(thread_ids))
+    unindex_rows(session, Thread, Thread.id.in_(thread_ids))
+    delete_rows(session, Post, Post.parent_id.in_(thread_ids))
+    delete_rows(session, Thread, Thread.id.in_(thread_ids))
+    delete_rows(session, Topic, Topic.id.in_([id for id in removed_topics if id != topic_id]))
+    row = delete_returning(
+        session, Topic, (Topic.id == topic_id) & (Topic.user_id == user_id),
+        Topic.parent_id, topic_parent_column(Topic.parent_id)
+    )
+    if row is None:
+        session.rollback()
+        return False
+    parent_id, grandparent_id = row
+    change_counters(session, Topic, parent_id, {'num_topics': -1})
+    bump_versions(session, Topic, [grandparent_id])
+    session.commit()
+    return True
+
+
+def remove_thread(session: Session, thread_id: int, user_id: int) -> bool:
+    condition = (Thread.id == thread_id) & (Thread.user_id == user_id)
+    owned_thread = select(Thread.id).where(condition)
+    unindex_rows(session, Post, Post.parent_id.in_(owned_thread))
+    unindex_rows(session, Thread, condition)
+    delete_rows(session, Post, Post.parent_id.in_(owned_thread))
+    row = delete_returning(
+        session, Thread, condition,
+        Thread.parent_id, topic_parent_column(Thread.parent_id), Thread.num_posts, Thread.last_post_id
+    )
+    if row is None:
+        session.rollback()
+        return False
+    parent_id, grandparent_id, num_posts, last_post_id = row
+    queue_invalidation(session, Thread, [thread_id])
+    queue_event(session, [('thread', thread_id)], read_models.closed())
+    change_counters(session, Topic, parent_id, {
+        'num_threads': -1,
+        'num_posts': -num_posts
+    })
+    if last_post_id is not None:
+        refresh_topic_last_post(session, parent_id)
+    bump_versions(session, Topic, [grandparent_id])
+    session.commit()
+    return True
@@ -0,0 +1,154 @@
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, Set, Tuple, AsyncIterator, Optional
+import asyncio
+import json
+import logging
+import os
+
+from read_models import render_json
+
+EVENT_BROKER_URL = os.environ['EVENT_BROKER_URL'] if 'EVENT_BROKER_URL' in os.environ else None
+EVENT_QUEUE_SIZE = int(os.environ['EVENT_QUEUE_SIZE']) if 'EVENT_QUEUE_SIZE' in os.environ else 256
+EVENT_HEARTBEAT = float(os.environ['EVENT_HEARTBEAT']) if 'EVENT_HEARTBEAT' in os.environ else 15
+EVENT_RECONNECT_MIN = float(os.environ['EVENT_RECONNECT_MIN']) if 'EVENT_RECONNECT_MIN' in os.environ else 0.5
+EVENT_RECONNECT_MAX = float(os.environ['EVENT_RECONNECT_MAX']) if 'EVENT_RECONNECT_MAX' in os.environ else 30
+
+Channel = Tuple[str, int]
+RESET = {'type': 'reset'}
+
+logger = logging.getLogger('events')
+
+
+class Subscriber:
+    def __init__(self, broker: 'LocalBroker', channel: Channel, loop: asyncio.AbstractEventLoop, max_size: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(max_size)
+
+    def __aiter__(self) -> AsyncIterator[Optional[dict]]:
+        return self
+
+    async def __anext__(self) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), EVENT_HEARTBEAT)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        self.broker.unsubscribe(self)
+
+    def put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+
+class LocalBroker:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.subscribers: Dict[Channel, Set[Subscriber]] = {}
+        self.lock = Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def wants(self, channel: Channel) -> bool:
+        return channel in self.subscribers
+
+    def publish(self, channel: Channel, event: dict):
+        self.deliver(channel, event)
+
+    def deliver(self, channel: Channel, event: dict):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+            self.published += 1
+            self.delivered += len(subscribers)
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.put, event)
+
+    def subscribe(self, channel: Channel) -> Subscriber:
+        subscriber = Subscriber(self, channel, asyncio.get_running_loop(), self.max_size)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[subscriber.channel]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'channels': len(self.subscribers),
+                'subscribers': sum(len(subscribers) for subscribers in self.subscribers.values()),
+                'published': self.published,
+                'delivered': self.delivered
+            }
+
+
+class RedisBroker(LocalBroker):
+    def __init__(self, client, errors: Tuple[type, ...], max_size: int):
+        super().__init__(max_size)
+        self.client = client
+        self.errors = errors
+        self.reconnects = 0
+        self.listener = Thread(target=self.listen, daemon=True)
+        self.listener.start()
+
+    def wants(self, channel: Channel) -> bool:
+        return True
+
+    def publish(self, channel: Channel, event: dict):
+        kind, id = channel
+        self.client.publish(f'events:{kind}:{id}', render_json(event))
+
+    def listen(self):
+        delay = EVENT_RECONNECT_MIN
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe('events:*')
+                if self.reconnects:
+                    self.reset_all()
+                delay = EVENT_RECONNECT_MIN
+                for message in pubsub.listen():
+                    try:
+                        _, kind, id = message['channel'].decode('ascii').split(':')
+                        channel, event = (kind, int(id)), json.loads(message['data'])
+                    except ValueError:
+                        logger.warning('ignoring malformed event on %r', message['channel'])
+                        continue
+                    self.deliver(channel, event)
+            except self.errors as error:
+                logger.warning('event broker connection lost (%s), reconnecting in %.1fs', error, delay)
+            self.reconnects += 1
+            sleep(delay)
+            delay = min(delay * 2, EVENT_RECONNECT_MAX)
+
+    def reset_all(self):
+        with self.lock:
+            channels = list(self.subscribers)
+        for channel in channels:
+            self.deliver(channel, RESET)
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'reconnects': self.reconnects}
+
+
+def make_broker():
+    if EVENT_BROKER_URL is not None:
+        import redis
+        return RedisBroker(redis.Redis.from_url(EVENT_BROKER_URL), (redis.RedisError, OSError), EVENT_QUEUE_SIZE)
+    return LocalBroker(EVENT_QUEUE_SIZE)
+
+
+broker = make_broker()
@@ -1,7 +1,7 @@
 from lorem import get_sentence, get_word
 from db_definitions import Topic, Thread, Post, User
 from random import randint
-from utils import make_password
+from passwords import make_password
 
 
 def make_topic():
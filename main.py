@@ -1,65 +1,469 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Response, Form
+from fastapi import FastAPI, Depends, HTTPException, status, Response, Form, Query, Header, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from db_definitions import DBSession
-from db_interactions import get_topic, get_thread, get_user_by_name, get_user_by_token
-from db_interactions import user_exists, add_user, init_db, set_user_token, thread_exists
-from db_interactions import add_post, post_belongs_to_user, remove_post
-from db_interactions import topic_exists, add_topic, add_thread
-from db_interactions import topic_belongs_to_user, thread_belongs_to_user
-from db_interactions import remove_topic, remove_thread, change_user_password
-from utils import password_is_good, check_password
-from schema import TopicResponse, ThreadResponse, User, TokenResponse, Error
+from db_definitions import DBSession, ASYNC_DB, pool_stats, Post, Thread, Topic, stickiness, use_primary
+from db_interactions import get_user_by_name, get_user_by_token
+from db_interactions import user_exists, add_user, init_db, set_user_token
+from db_interactions import add_post, add_posts, remove_post, add_topic, add_thread
+from db_interactions import remove_topic, remove_thread, change_user_password, update_user_password_hash
+from db_interactions import THREAD_PAGE_SIZE, THREAD_MAX_PAGE_SIZE, POST_BATCH_MAX_SIZE, READ_BATCH_MAX_SIZE
+from db_interactions import get_topic_version, get_thread_version, get_versions
+from db_interactions import get_topic_snapshot, get_thread_snapshot, stream_topic, stream_thread, search
+from db_interactions import get_topic, get_thread, get_topics, get_threads
+from search import SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+from utils import password_is_good
+from passwords import make_password_async, check_password_async, needs_rehash
+from response_cache import response_cache, CachedResponse, Group
+from compression import negotiate, compress, compress_stream, weak_etag, COMPRESSION_MIN_SIZE
+from token_cache import hash_token
+from read_models import render_json, topic_response, thread_response, search_response, batch_response, split_template
+from events import broker, Channel
+from metrics import MetricsMiddleware, registry, route_name
+from rate_limit import AdmissionMiddleware, rate_limiter, concurrency_limiter, retry_after_header, client_ip
+from write_queue import PostQueue, PendingPost, WRITE_BEHIND_WINDOW, WRITE_BEHIND_MAX_BATCH
+from schema import TopicResponse, ThreadResponse, SearchResponse, BatchResponse, User, TokenResponse, Error, PostBatch
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Union, Callable, TypeVar, List, Literal, AsyncIterator, Iterator, Hashable, Tuple
+
+if ASYNC_DB:
+    from db_definitions import AsyncDBSession
 
 init_db()
 
 app = FastAPI()
+app.add_middleware(AdmissionMiddleware, router=app.router)
+app.add_middleware(MetricsMiddleware)
 
 oauth2_schema = OAuth2PasswordBearer(tokenUrl='/api/authenticate')
 
 
-def get_db():
+Database = Union[Session, AsyncSession]
+T = TypeVar('T')
+
+
+READ_METHODS = {'GET', 'HEAD'}
+
+
+def route_session(db: Database, request: Request):
+    authorization = request.headers.get('Authorization')
+    key = hash_token(authorization[7:]) if authorization and authorization.startswith('Bearer ') else None
+    db.info['sticky_key'] = key
+    if request.method not in READ_METHODS:
+        use_primary(db)
+        if key is not None:
+            stickiness.stick(key)
+    elif stickiness.is_sticky(key):
+        use_primary(db)
+
+
+async def get_db(request: Request):
+    if ASYNC_DB:
+        async with AsyncDBSession() as db:
+            route_session(db, request)
+            yield db
+    else:
+        db = DBSession()
+        try:
+            route_session(db, request)
+            yield db
+        finally:
+            db.close()
+
+
+async def run_db(db: Database, fn: Callable[..., T], *args) -> T:
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+async def run_in_session(fn: Callable[..., T], *args, primary: bool = False) -> T:
+    if ASYNC_DB:
+        async with AsyncDBSession() as db:
+            if primary:
+                use_primary(db)
+            return await run_db(db, fn, *args)
     db = DBSession()
     try:
-        yield db
+        if primary:
+            use_primary(db)
+        return await run_db(db, fn, *args)
     finally:
         db.close()
 
 
-def require_user(token: str = Depends(oauth2_schema), db: Session = Depends(get_db)):
-    user = get_user_by_token(db, token)
+async def flush_posts(posts: List[PendingPost]) -> List[bool]:
+    return await run_in_session(add_posts, posts, False, primary=True)
+
+
+post_queue = PostQueue(WRITE_BEHIND_WINDOW, WRITE_BEHIND_MAX_BATCH, flush_posts) if WRITE_BEHIND_WINDOW > 0 else None
+
+
+async def enforce_rate_limit(request: Request, kind: str, id):
+    wait = await rate_limiter.retry_after(kind, id, route_name(request.scope))
+    if wait > 0:
+        raise HTTPException(status_code=429, detail='Too many requests', headers=retry_after_header(wait))
+
+
+async def require_user(request: Request, token: str = Depends(oauth2_schema), db: Database = Depends(get_db)):
+    use_primary(db)
+    user = await run_db(db, get_user_by_token, token)
     if user is None:
         raise HTTPException(status_code=401, detail='Invalid token')
+    await enforce_rate_limit(request, 'user', user.id)
     return user
 
 
+def make_etag(*parts) -> str:
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(
+        tag[2:] == etag if tag.startswith('W/') else tag == etag
+        for tag in tags
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def json_response(
+        body: bytes, accept_encoding: Optional[str], etag: Optional[str] = None,
+        encode: Optional[Callable[[str], bytes]] = None
+) -> Response:
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = negotiate(accept_encoding) if len(body) >= COMPRESSION_MIN_SIZE else None
+    if encoding is not None:
+        body = encode(encoding) if encode is not None else compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    if etag is not None:
+        headers['ETag'] = weak_etag(etag) if encoding is not None else etag
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+def cached_response(
+        group: Group, key: Hashable, entry: CachedResponse,
+        if_none_match: Optional[str], accept_encoding: Optional[str]
+) -> Response:
+    if etag_matches(if_none_match, entry.etag):
+        return not_modified(entry.etag)
+    return json_response(
+        entry.body, accept_encoding, entry.etag,
+        lambda encoding: response_cache.encode(group, key, entry, encoding)
+    )
+
+
+def streaming_json_response(chunks: Iterator[bytes], etag: str, accept_encoding: Optional[str]) -> Response:
+    headers = {'ETag': etag, 'Vary': 'Accept-Encoding'}
+    encoding = negotiate(accept_encoding)
+    if encoding is not None:
+        chunks = compress_stream(chunks, encoding)
+        headers['ETag'] = weak_etag(etag)
+        headers['Content-Encoding'] = encoding
+    return StreamingResponse(chunks, media_type='application/json', headers=headers)
+
+
 @app.get(
     '/api/topic/{topic_id}', response_model=TopicResponse,
-    responses={400: {'model': Error}}
+    responses={304: {}, 400: {'model': Error}}
 )
-def read_topic(topic_id: int, db: Session = Depends(get_db)):
-    topic = get_topic(db, topic_id)
+async def read_topic(
+        topic_id: int,
+        stream: bool = False,
+        if_none_match: Optional[str] = Header(None),
+        accept_encoding: Optional[str] = Header(None),
+        db: Database = Depends(get_db)
+):
+    if stream:
+        return await stream_topic_response(topic_id, if_none_match, accept_encoding, db)
+    group = ('topic', topic_id)
+    key = None
+    cached = response_cache.get(group, key)
+    if cached is not None and not db.info.get('primary') and response_cache.is_fresh(group, key, cached):
+        return cached_response(group, key, cached, if_none_match, accept_encoding)
+    generation = response_cache.generation(group)
+    version = await run_db(db, get_topic_version, topic_id)
+    if version is None:
+        raise HTTPException(status_code=400, detail='Topic does not exist')
+    etag = make_etag('topic', topic_id, version)
+    if cached is not None and cached.etag == etag:
+        response_cache.revalidated(group, key, cached)
+        return cached_response(group, key, cached, if_none_match, accept_encoding)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    topic = await run_db(db, get_topic, topic_id)
     if topic is None:
         raise HTTPException(status_code=400, detail='Topic does not exist')
-    response = TopicResponse(data=topic)
-    return response
+    entry = CachedResponse(render_json(topic_response(topic)), etag, {})
+    response_cache.set(group, key, entry, generation)
+    return cached_response(group, key, entry, None, accept_encoding)
 
 
 @app.get(
     '/api/thread/{thread_id}', response_model=ThreadResponse,
-    responses={400: {'model': Error}}
+    responses={304: {}, 400: {'model': Error}}
 )
-def read_thread(thread_id: int, db: Session = Depends(get_db)):
-    thread = get_thread(db, thread_id)
-    if thread is None:
+async def read_thread(
+        thread_id: int,
+        cursor: Optional[int] = None,
+        limit: Optional[int] = Query(None, ge=1, le=THREAD_MAX_PAGE_SIZE),
+        stream: bool = False,
+        if_none_match: Optional[str] = Header(None),
+        accept_encoding: Optional[str] = Header(None),
+        db: Database = Depends(get_db)
+):
+    if stream:
+        return await stream_thread_response(thread_id, cursor, limit, if_none_match, accept_encoding, db)
+    if limit is None:
+        limit = THREAD_PAGE_SIZE
+    group = ('thread', thread_id)
+    key = (cursor, limit)
+    cached = response_cache.get(group, key)
+    if cached is not None and not db.info.get('primary') and response_cache.is_fresh(group, key, cached):
+        return cached_response(group, key, cached, if_none_match, accept_encoding)
+    generation = response_cache.generation(group)
+    version = await run_db(db, get_thread_version, thread_id)
+    if version is None:
         raise HTTPException(status_code=400, detail='Thread does not exist')
-    response = ThreadResponse(data=thread)
-    return response
+    etag = make_etag('thread', thread_id, version, cursor, limit)
+    if cached is not None and cached.etag == etag:
+        response_cache.revalidated(group, key, cached)
+        return cached_response(group, key, cached, if_none_match, accept_encoding)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    result = await run_db(db, get_thread, thread_id, cursor, limit)
+    if result is None:
+        raise HTTPException(status_code=400, detail='Thread does not exist')
+    thread, next_cursor = result
+    entry = CachedResponse(render_json(thread_response(thread, next_cursor)), etag, {})
+    response_cache.set(group, key, entry, generation)
+    return cached_response(group, key, entry, None, accept_encoding)
+
+
+def stream_session(db: Database) -> Session:
+    session = DBSession()
+    if db.info.get('primary'):
+        use_primary(session)
+    return session
+
+
+async def stream_topic_response(
+        topic_id: int, if_none_match: Optional[str],
+        accept_encoding: Optional[str], db: Database
+) -> Response:
+    session = stream_session(db)
+    try:
+        snapshot = await run_in_threadpool(get_topic_snapshot, session, topic_id)
+        if snapshot is None:
+            raise HTTPException(status_code=400, detail='Topic does not exist')
+        version, topic = snapshot
+        etag = make_etag('topic', topic_id, version, 'stream')
+        if etag_matches(if_none_match, etag):
+            await run_in_threadpool(session.close)
+            return not_modified(etag)
+    except BaseException:
+        await run_in_threadpool(session.close)
+        raise
+    return streaming_json_response(stream_topic(session, topic_id, topic), etag, accept_encoding)
+
+
+async def stream_thread_response(
+        thread_id: int, cursor: Optional[int], limit: Optional[int],
+        if_none_match: Optional[str], accept_encoding: Optional[str], db: Database
+) -> Response:
+    session = stream_session(db)
+    try:
+        snapshot = await run_in_threadpool(get_thread_snapshot, session, thread_id, cursor, limit)
+        if snapshot is None:
+            raise HTTPException(status_code=400, detail='Thread does not exist')
+        version, thread, next_cursor = snapshot
+        etag = make_etag('thread', thread_id, version, cursor, limit, 'stream')
+        if etag_matches(if_none_match, etag):
+            await run_in_threadpool(session.close)
+            return not_modified(etag)
+    except BaseException:
+        await run_in_threadpool(session.close)
+        raise
+    return streaming_json_response(
+        stream_thread(session, thread_id, cursor, limit, thread, next_cursor), etag, accept_encoding
+    )
+
+
+SEARCH_MODELS = {
+    'posts': Post,
+    'threads': Thread
+}
+
+
+@app.get('/api/search', response_model=SearchResponse, responses={400: {'model': Error}})
+async def read_search(
+        q: str,
+        kind: Literal['posts', 'threads'] = 'posts',
+        topic_id: Optional[int] = None,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+        accept_encoding: Optional[str] = Header(None),
+        db: Database = Depends(get_db)
+):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail='Empty query')
+    results, next_offset = await run_db(db, search, SEARCH_MODELS[kind], q, topic_id, offset, limit)
+    return json_response(render_json(search_response(results, next_offset)), accept_encoding)
+
+
+def parse_thread_ref(ref: str) -> Tuple[int, Optional[int]]:
+    id, _, cursor = ref.partition(':')
+    try:
+        return int(id), int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f'Invalid thread reference {ref!r}')
+
+
+@app.get('/api/batch', response_model=BatchResponse, responses={400: {'model': Error}})
+async def read_batch(
+        topic_id: List[int] = Query([]),
+        thread: List[str] = Query([]),
+        limit: int = Query(THREAD_PAGE_SIZE, ge=1, le=THREAD_MAX_PAGE_SIZE),
+        accept_encoding: Optional[str] = Header(None),
+        db: Database = Depends(get_db)
+):
+    if len(topic_id) + len(thread) > READ_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f'At most {READ_BATCH_MAX_SIZE} items per batch')
+    thread_pages = [(id, cursor, limit) for id, cursor in map(parse_thread_ref, thread)]
+    items = [(('topic', id), None) for id in topic_id] + [
+        (('thread', id), (cursor, limit)) for id, cursor, limit in thread_pages
+    ]
+    bodies = {}
+    stale = {}
+    for group, key in items:
+        cached = response_cache.get(group, key)
+        if cached is not None and not db.info.get('primary') and response_cache.is_fresh(group, key, cached):
+            bodies[group, key] = cached.body
+        else:
+            stale[group, key] = cached
+    generations = {item: response_cache.generation(item[0]) for item in stale}
+    stale_topics = [id for (kind, id), _ in stale if kind == 'topic']
+    stale_threads = [id for (kind, id), _ in stale if kind == 'thread']
+    topic_versions = await run_db(db, get_versions, Topic, stale_topics) if stale_topics else {}
+    thread_versions = await run_db(db, get_versions, Thread, stale_threads) if stale_threads else {}
+    missing_topics = []
+    missing_threads = []
+    for (group, key), cached in stale.items():
+        kind, id = group
+        if kind == 'topic':
+            version = topic_versions.get(id)
+            etag = make_etag(kind, id, version)
+        else:
+            version = thread_versions.get(id)
+            etag = make_etag(kind, id, version, *key)
+        if version is None:
+            continue
+        if cached is not None and cached.etag == etag:
+            response_cache.revalidated(group, key, cached)
+            bodies[group, key] = cached.body
+        elif kind == 'topic':
+            missing_topics.append(id)
+        else:
+            missing_threads.append((id, *key))
+    if missing_topics:
+        topics = await run_db(db, get_topics, missing_topics)
+        for id, (version, topic) in topics.items():
+            group = ('topic', id)
+            entry = CachedResponse(render_json(topic_response(topic)), make_etag('topic', id, version), {})
+            response_cache.set(group, None, entry, generations[group, None])
+            bodies[group, None] = entry.body
+    if missing_threads:
+        threads = await run_db(db, get_threads, missing_threads)
+        for (id, cursor, _), (version, thread_data, next_cursor) in threads.items():
+            group, key = ('thread', id), (cursor, limit)
+            entry = CachedResponse(
+                render_json(thread_response(thread_data, next_cursor)),
+                make_etag('thread', id, version, cursor, limit), {}
+            )
+            response_cache.set(group, key, entry, generations[group, key])
+            bodies[group, key] = entry.body
+    head, middle, tail = split_template(batch_response([], []), 'topics', 'threads')
+    n_topics = len(topic_id)
+    body = b''.join([
+        head, b','.join(bodies.get(item, b'null') for item in items[:n_topics]),
+        middle, b','.join(bodies.get(item, b'null') for item in items[n_topics:]),
+        tail
+    ])
+    return json_response(body, accept_encoding)
+
+
+@app.get('/api/events', responses={400: {'model': Error}})
+async def read_events(thread_id: Optional[int] = None, topic_id: Optional[int] = None):
+    if (thread_id is None) == (topic_id is None):
+        raise HTTPException(status_code=400, detail='Specify either thread_id or topic_id')
+    if thread_id is not None:
+        if await run_in_session(get_thread_version, thread_id) is None:
+            raise HTTPException(status_code=400, detail='Thread does not exist')
+        channel = ('thread', thread_id)
+    else:
+        if await run_in_session(get_topic_version, topic_id) is None:
+            raise HTTPException(status_code=400, detail='Topic does not exist')
+        channel = ('topic', topic_id)
+    return StreamingResponse(
+        event_stream(channel), media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def event_stream(channel: Channel) -> AsyncIterator[bytes]:
+    events = broker.subscribe(channel)
+    try:
+        yield b': subscribed\n\n'
+        async for data in events:
+            if data is None:
+                yield b': ping\n\n'
+                continue
+            yield b'event: ' + data['type'].encode('ascii') + b'\ndata: ' + render_json(data) + b'\n\n'
+            if data['type'] == 'closed':
+                return
+    finally:
+        await events.aclose()
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def read_metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.get('/api/stats/pool')
+async def read_pool_stats():
+    return pool_stats()
+
+
+@app.get('/api/stats/cache')
+async def read_cache_stats():
+    return response_cache.stats()
+
+
+@app.get('/api/stats/writes')
+async def read_write_stats():
+    return post_queue.stats() if post_queue is not None else {}
+
+
+@app.get('/api/stats/events')
+async def read_event_stats():
+    return broker.stats()
+
+
+@app.get('/api/stats/admission')
+async def read_admission_stats():
+    return {**concurrency_limiter.stats(), **rate_limiter.stats()}
 
 
 @app.get('/api/user', response_model=User, responses={401: {'model': Error}})
-def read_user(user: User = Depends(require_user)):
+async def read_user(user: User = Depends(require_user)):
     return user
 
 
@@ -67,13 +471,19 @@ def read_user(user: User = Depends(require_user)):
     '/api/authenticate', response_model=TokenResponse,
     responses={400: {'model': Error}}
 )
-def request_token(form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    if not user_exists(db, form.username):
+async def request_token(
+        request: Request, form: OAuth2PasswordRequestForm = Depends(), db: Database = Depends(get_db)
+):
+    await enforce_rate_limit(request, 'name', f'{client_ip(request.scope)}:{form.username.lower()}')
+    user = await run_db(db, get_user_by_name, form.username)
+    if user is None:
         raise HTTPException(status_code=400, detail='User does not exist')
-    user = get_user_by_name(db, form.username)
-    check = check_password(form.password, user.password_hash, user.password_salt)
+    check = await check_password_async(form.password, user.password_hash, user.password_salt)
     if check:
-        token = set_user_token(db, form.username)
+        if needs_rehash(user.password_hash):
+            hash, salt = await make_password_async(form.password)
+            await run_db(db, update_user_password_hash, user.id, hash, salt)
+        token = await run_db(db, set_user_token, user)
         return {
             'access_token': token,
             'token_type': 'bearer'
@@ -86,15 +496,16 @@ def request_token(form: OAuth2PasswordRequestForm = Depends(), db: Session = Dep
     '/api/signup', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}}
 )
-def create_user(
+async def create_user(
         username: str = Form(...), password: str = Form(...),
-        db: Session = Depends(get_db)
+        db: Database = Depends(get_db)
 ):
-    if user_exists(db, username):
+    if await run_db(db, user_exists, username):
         raise HTTPException(status_code=400, detail='User already exists')
     if not password_is_good(password):
         raise HTTPException(status_code=400, detail='Password is not good')
-    add_user(db, username, password)
+    hash, salt = await make_password_async(password)
+    await run_db(db, add_user, username, hash, salt)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -102,13 +513,35 @@ def create_user(
     '/api/message', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def post_message(
+async def post_message(
     thread_id: int = Form(...),
     message: str = Form(...),
-    user: User = Depends(require_user), db: Session = Depends(get_db)
+    user: User = Depends(require_user), db: Database = Depends(get_db)
+):
+    if post_queue is not None:
+        added = await post_queue.submit((thread_id, user.id, message))
+    else:
+        added = await run_db(db, add_post, thread_id, user, message)
+    if added:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    else:
+        raise HTTPException(status_code=400, detail='Thread does not exist')
+
+
+@app.post(
+    '/api/messages', status_code=status.HTTP_204_NO_CONTENT,
+    responses={400: {'model': Error}, 401: {'model': Error}}
+)
+async def post_messages(
+    batch: PostBatch,
+    user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if thread_exists(db, thread_id):
-        add_post(db, thread_id, user, message)
+    if not batch.posts:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    if len(batch.posts) > POST_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail='Too many posts')
+    posts = [(post.threadId, user.id, post.text) for post in batch.posts]
+    if all(await run_db(db, add_posts, posts)):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='Thread does not exist')
@@ -118,12 +551,11 @@ def post_message(
     '/api/message', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def delete_message(
+async def delete_message(
     post_id: int = Form(...),
-    user: User = Depends(require_user), db: Session = Depends(get_db)
+    user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if post_belongs_to_user(db, post_id, user.id):
-        remove_post(db, post_id)
+    if await run_db(db, remove_post, post_id, user.id):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='The post does not belong to the user')
@@ -133,13 +565,12 @@ def delete_message(
     '/api/topic', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def create_topic(
+async def create_topic(
         title: str = Form(...),
         parent_id: int = Form(...),
-        user: User = Depends(require_user), db: Session = Depends(get_db)
+        user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if topic_exists(db, parent_id):
-        add_topic(db, title, parent_id, user.id)
+    if await run_db(db, add_topic, title, parent_id, user.id):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='Parent topic does not exist')
@@ -149,14 +580,13 @@ def create_topic(
     '/api/thread', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def create_thread(
+async def create_thread(
         title: str = Form(...),
         parent_id: int = Form(...),
         is_vegan: bool = Form(...),
-        user: User = Depends(require_user), db: Session = Depends(get_db)
+        user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if topic_exists(db, parent_id):
-        add_thread(db, title, is_vegan, parent_id, user.id)
+    if await run_db(db, add_thread, title, is_vegan, parent_id, user.id):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='Parent topic does not exist')
@@ -166,12 +596,11 @@ def create_thread(
     '/api/topic', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def delete_topic(
+async def delete_topic(
         topic_id: int = Form(...),
-        user: User = Depends(require_user), db: Session = Depends(get_db)
+        user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if topic_belongs_to_user(db, topic_id, user.id):
-        remove_topic(db, topic_id)
+    if await run_db(db, remove_topic, topic_id, user.id):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='The topic does not belong to the user')
@@ -181,12 +610,11 @@ def delete_topic(
     '/api/thread', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def delete_thread(
+async def delete_thread(
         thread_id: int = Form(...),
-        user: User = Depends(require_user), db: Session = Depends(get_db)
+        user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    if thread_belongs_to_user(db, thread_id, user.id):
-        remove_thread(db, thread_id)
+    if await run_db(db, remove_thread, thread_id, user.id):
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='The thread does not belong to the user')
@@ -196,14 +624,15 @@ def delete_thread(
     '/api/password', status_code=status.HTTP_204_NO_CONTENT,
     responses={400: {'model': Error}, 401: {'model': Error}}
 )
-def change_password(
+async def change_password(
         old_password: str = Form(...), new_password: str = Form(...),
-        user: User = Depends(require_user), db: Session = Depends(get_db)
+        user: User = Depends(require_user), db: Database = Depends(get_db)
 ):
-    db_user = get_user_by_name(db, user.name)
-    check = check_password(old_password, db_user.password_hash, db_user.password_salt)
+    db_user = await run_db(db, get_user_by_name, user.name)
+    check = await check_password_async(old_password, db_user.password_hash, db_user.password_salt)
     if check:
-        change_user_password(db, user.id, new_password)
+        hash, salt = await make_password_async(new_password)
+        await run_db(db, change_user_password, user.id, hash, salt)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     else:
         raise HTTPException(status_code=400, detail='Wrong password')
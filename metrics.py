@@ -0,0 +1,200 @@
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Optional, List, Dict, Tuple
+import logging
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, ORMExecuteState
+
+SLOW_REQUEST_SECONDS = float(os.environ['SLOW_REQUEST_SECONDS']) if 'SLOW_REQUEST_SECONDS' in os.environ else None
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger('slow_requests')
+
+
+class RequestMetrics:
+    def __init__(self, keep_statements: bool):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+        self.statements: Optional[List[Tuple[float, str]]] = [] if keep_statements else None
+
+
+current: 'ContextVar[Optional[RequestMetrics]]' = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+
+
+class Registry:
+    def __init__(self):
+        self.routes: Dict[str, RouteMetrics] = {}
+        self.lock = Lock()
+
+    def record(self, route: str, status: int, seconds: float, request: RequestMetrics):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics()
+            metrics.duration.observe(seconds)
+            metrics.queries.observe(request.queries)
+            metrics.db_seconds += request.db_seconds
+            metrics.rows += request.rows
+            metrics.serialization_seconds += request.serialization_seconds
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            routes = sorted(self.routes.items())
+            add_histogram(lines, 'forum_request_duration_seconds', 'Wall time per request', [
+                (route, metrics.duration) for route, metrics in routes
+            ])
+            add_histogram(lines, 'forum_request_queries', 'SQL statements per request', [
+                (route, metrics.queries) for route, metrics in routes
+            ])
+            add_counter(lines, 'forum_request_db_seconds_total', 'Time spent executing SQL', [
+                (f'route="{route}"', metrics.db_seconds) for route, metrics in routes
+            ])
+            add_counter(lines, 'forum_request_rows_total', 'Rows fetched by SELECT statements', [
+                (f'route="{route}"', metrics.rows) for route, metrics in routes
+            ])
+            add_counter(lines, 'forum_request_serialization_seconds_total', 'Time spent rendering JSON', [
+                (f'route="{route}"', metrics.serialization_seconds) for route, metrics in routes
+            ])
+            add_counter(lines, 'forum_requests_total', 'Requests by status', [
+                (f'route="{route}",status="{status}"', count)
+                for route, metrics in routes
+                for status, count in sorted(metrics.statuses.items())
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+def add_histogram(lines: List[str], name: str, help: str, histograms: List[Tuple[str, Histogram]]):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} histogram')
+    for route, histogram in histograms:
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{route="{route}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{route="{route}"}} {histogram.total}')
+        lines.append(f'{name}_count{{route="{route}"}} {histogram.count}')
+
+
+def add_counter(lines: List[str], name: str, help: str, samples: List[Tuple[str, float]]):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} counter')
+    for labels, value in samples:
+        lines.append(f'{name}{{{labels}}} {value}')
+
+
+registry = Registry()
+
+
+def add_serialization(seconds: float):
+    request = current.get()
+    if request is not None:
+        request.serialization_seconds += seconds
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    if current.get() is not None:
+        conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def finish_query(conn, cursor, statement, parameters, context, executemany):
+    request = current.get()
+    if request is None or not conn.info.get('query_started'):
+        return
+    elapsed = perf_counter() - conn.info['query_started'].pop()
+    request.db_seconds += elapsed
+    request.queries += 1
+    if request.statements is not None:
+        request.statements.append((elapsed, statement))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def count_rows(state: ORMExecuteState):
+    request = current.get()
+    if request is None or not state.is_select or 'yield_per' in state.execution_options \
+            or state.execution_options.get('stream_results'):
+        return None
+    result = state.invoke_statement().freeze()
+    request.rows += len(result.data)
+    return result()
+
+
+def route_name(scope: dict) -> str:
+    endpoint = scope.get('endpoint')
+    return endpoint.__name__ if endpoint is not None else 'unmatched'
+
+
+def log_slow_request(route: str, seconds: float, request: RequestMetrics):
+    statements = '\n'.join(
+        f'  {elapsed * 1000:.2f} ms: {" ".join(statement.split())}'
+        for elapsed, statement in request.statements
+    )
+    logger.warning(
+        '%s took %.1f ms (db %.1f ms, %d queries, serialization %.1f ms)\n%s',
+        route, seconds * 1000, request.db_seconds * 1000, request.queries,
+        request.serialization_seconds * 1000, statements
+    )
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        request = RequestMetrics(SLOW_REQUEST_SECONDS is not None)
+        token = current.set(request)
+        started = perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = perf_counter() - started
+            current.reset(token)
+            route = route_name(scope)
+            registry.record(route, status, seconds, request)
+            if SLOW_REQUEST_SECONDS is not None and seconds >= SLOW_REQUEST_SECONDS:
+                log_slow_request(route, seconds, request)
@@ -0,0 +1,31 @@
+import argparse
+import logging
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bring the database schema up to the current version')
+    parser.add_argument('--target', type=int, help='stop after this migration')
+    parser.add_argument('--status', action='store_true', help='print the current version and pending migrations')
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    if args.database_url is not None:
+        os.environ['DATABASE_URL'] = args.database_url
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    from db_definitions import engine
+    from migrations import MIGRATIONS, HEAD, current_version, migrate
+
+    if args.status:
+        with engine.connect() as connection:
+            version = current_version(connection)
+        print(f'version: {version}, head: {HEAD}')
+        for migration in MIGRATIONS:
+            if version is None or migration.version > version:
+                print(f'pending: {migration.version:03d} {migration.name}')
+        return
+    migrate(engine, args.target)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+from time import perf_counter
+from typing import Callable, List, NamedTuple, Optional, Set
+import logging
+import os
+
+from sqlalchemy import inspect, select, insert, update, text, bindparam, Table
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+
+from db_definitions import Base, DBSession, Topic, Thread, Post, User, SQLITE_PRAGMAS
+from db_definitions import schema_version, use_primary
+from passwords import make_password
+from search import create_search_index
+from token_cache import hash_token
+
+ROOT_PASSWORD = os.environ['ROOT_PASSWORD'] if 'ROOT_PASSWORD' in os.environ else 'toor'
+
+logger = logging.getLogger('migrations')
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Engine], None]
+
+
+def column_names(connection: Connection, table_name: str) -> Set[str]:
+    return {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+
+def index_names(connection: Connection, table_name: str) -> Set[str]:
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+
+def add_columns(engine: Engine, table: Table, names: List[str]) -> List[str]:
+    added = []
+    with engine.begin() as connection:
+        existing = column_names(connection, table.name)
+        compiler = connection.dialect.ddl_compiler(connection.dialect, None)
+        for name in names:
+            if name in existing:
+                continue
+            spec = compiler.get_column_specification(table.c[name])
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {spec}'))
+            added.append(name)
+    return added
+
+
+def create_indexes(engine: Engine, table: Table, names: List[str]):
+    with engine.begin() as connection:
+        existing = index_names(connection, table.name)
+        for index in table.indexes:
+            if index.name in names and index.name not in existing:
+                index.create(connection)
+
+
+def drop_index(engine: Engine, table: Table, name: str):
+    with engine.begin() as connection:
+        if name in index_names(connection, table.name):
+            connection.execute(text(f'DROP INDEX {name}'))
+
+
+def run_in_session(engine: Engine, fn: Callable[[Session], None]):
+    session = DBSession(bind=engine)
+    use_primary(session)
+    try:
+        fn(session)
+    finally:
+        session.close()
+
+
+def add_parent_indexes(engine: Engine):
+    create_indexes(engine, Topic.__table__, ['ix_topics_parent_id'])
+    create_indexes(engine, Thread.__table__, ['ix_threads_parent_id'])
+
+
+def add_post_page_index(engine: Engine):
+    create_indexes(engine, Post.__table__, ['ix_posts_parent_id_id'])
+
+
+def add_versions(engine: Engine):
+    add_columns(engine, Topic.__table__, ['version'])
+    add_columns(engine, Thread.__table__, ['version'])
+
+
+def add_token_generation(engine: Engine):
+    add_columns(engine, User.__table__, ['token_generation'])
+
+
+def add_counters(engine: Engine):
+    from db_interactions import repair_counters
+    added = add_columns(engine, Topic.__table__, [
+        'num_topics', 'num_threads', 'num_posts', 'last_post_id', 'last_post_at', 'last_post_user_id'
+    ])
+    added += add_columns(engine, Thread.__table__, [
+        'num_posts', 'last_post_id', 'last_post_at', 'last_post_user_id'
+    ])
+    add_columns(engine, Post.__table__, ['created_at'])
+    if added:
+        run_in_session(engine, repair_counters)
+
+
+def has_cascade(connection: Connection, table: Table) -> bool:
+    return any(
+        foreign_key['constrained_columns'] == ['parent_id']
+        and foreign_key['options'].get('ondelete', '').upper() == 'CASCADE'
+        for foreign_key in inspect(connection).get_foreign_keys(table.name)
+    )
+
+
+def rebuild_sqlite_table(engine: Engine, table: Table):
+    with engine.connect() as connection:
+        if has_cascade(connection, table):
+            return
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            with connection.begin():
+                existing = column_names(connection, table.name)
+                columns = ', '.join(column.name for column in table.columns if column.name in existing)
+                create = str(CreateTable(table).compile(connection))\
+                    .replace(f'CREATE TABLE {table.name} (', f'CREATE TABLE {table.name}_new (', 1)
+                connection.execute(text(create))
+                connection.execute(text(
+                    f'INSERT INTO {table.name}_new ({columns}) SELECT {columns} FROM {table.name}'
+                ))
+                connection.execute(text(f'DROP TABLE {table.name}'))
+                connection.execute(text(f'ALTER TABLE {table.name}_new RENAME TO {table.name}'))
+                for index in table.indexes:
+                    index.create(connection)
+        finally:
+            connection.exec_driver_sql(f'PRAGMA foreign_keys={SQLITE_PRAGMAS["foreign_keys"]}')
+
+
+def replace_foreign_key(engine: Engine, table: Table):
+    with engine.begin() as connection:
+        for foreign_key in inspect(connection).get_foreign_keys(table.name):
+            if foreign_key['constrained_columns'] != ['parent_id']:
+                continue
+            if foreign_key['options'].get('ondelete', '').upper() == 'CASCADE':
+                continue
+            name = foreign_key['name']
+            connection.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT {name}'))
+            connection.execute(text(
+                f'ALTER TABLE {table.name} ADD CONSTRAINT {name} FOREIGN KEY (parent_id) '
+                f'REFERENCES {foreign_key["referred_table"]} (id) ON DELETE CASCADE'
+            ))
+
+
+def add_cascade_deletes(engine: Engine):
+    for table in (Topic.__table__, Thread.__table__, Post.__table__):
+        if engine.dialect.name == 'sqlite':
+            rebuild_sqlite_table(engine, table)
+        else:
+            replace_foreign_key(engine, table)
+
+
+def add_search_index(engine: Engine):
+    run_in_session(engine, create_search_index)
+
+
+def hash_tokens(engine: Engine):
+    users = User.__table__
+    add_columns(engine, users, ['token_hash'])
+    create_indexes(engine, users, ['ix_users_token_hash'])
+    with engine.begin() as connection:
+        tokens = connection.execute(select(users.c.id, users.c.token).where(users.c.token.isnot(None))).all()
+        if tokens:
+            connection.execute(
+                update(users)
+                .where(users.c.id == bindparam('user_id'))
+                .values(token_hash=bindparam('hash'), token=None),
+                [{'user_id': id, 'hash': hash_token(token)} for id, token in tokens]
+            )
+    drop_index(engine, users, 'ix_users_token')
+
+
+MIGRATIONS = [
+    Migration(1, 'parent_indexes', add_parent_indexes),
+    Migration(2, 'post_page_index', add_post_page_index),
+    Migration(3, 'versions', add_versions),
+    Migration(4, 'token_generation', add_token_generation),
+    Migration(5, 'counters', add_counters),
+    Migration(6, 'cascade_deletes', add_cascade_deletes),
+    Migration(7, 'search_index', add_search_index),
+    Migration(8, 'token_hash', hash_tokens),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(connection: Connection) -> Optional[int]:
+    try:
+        return connection.execute(select(schema_version.c.version)).scalar()
+    except DBAPIError:
+        return None
+
+
+def set_version(engine: Engine, version: int):
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+        if connection.execute(update(schema_version).values(version=version)).rowcount == 0:
+            connection.execute(insert(schema_version).values(version=version))
+
+
+def check_schema(engine: Engine):
+    with engine.connect() as connection:
+        version = current_version(connection)
+    if version is None or version < HEAD:
+        raise RuntimeError(
+            f'Database schema is at version {version}, this code needs {HEAD}. Run python migrate.py first.'
+        )
+
+
+def seed(session: Session):
+    if session.query(User).filter(User.id == 0).count() == 0:
+        hash, salt = make_password(ROOT_PASSWORD)
+        session.add(User(id=0, name='root', password_hash=hash, password_salt=salt))
+    if session.query(Topic).filter(Topic.id == 0).count() == 0:
+        session.add(Topic(id=0, title='Home', user_id=0))
+    session.commit()
+
+
+def create_schema(engine: Engine):
+    Base.metadata.create_all(engine)
+    run_in_session(engine, create_search_index)
+    set_version(engine, HEAD)
+
+
+def migrate(engine: Engine, target: Optional[int] = None):
+    target = HEAD if target is None else target
+    with engine.connect() as connection:
+        is_empty = not inspect(connection).has_table(User.__tablename__)
+        version = current_version(connection) or 0
+    if is_empty:
+        started = perf_counter()
+        create_schema(engine)
+        run_in_session(engine, seed)
+        logger.info('created schema at version %d in %.2fs', HEAD, perf_counter() - started)
+    else:
+        for migration in MIGRATIONS:
+            if not version < migration.version <= target:
+                continue
+            started = perf_counter()
+            migration.apply(engine)
+            set_version(engine, migration.version)
+            logger.info('applied %03d %s in %.2fs', migration.version, migration.name, perf_counter() - started)
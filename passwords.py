@@ -0,0 +1,152 @@
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from hashlib import sha512, scrypt, pbkdf2_hmac
+from typing import Optional, Tuple
+import asyncio
+import hmac
+import os
+import secrets
+
+PASSWORD_HASHER = os.environ['PASSWORD_HASHER'] if 'PASSWORD_HASHER' in os.environ else 'scrypt'
+SCRYPT_N = int(os.environ['SCRYPT_N']) if 'SCRYPT_N' in os.environ else 2 ** 14
+SCRYPT_R = int(os.environ['SCRYPT_R']) if 'SCRYPT_R' in os.environ else 8
+SCRYPT_P = int(os.environ['SCRYPT_P']) if 'SCRYPT_P' in os.environ else 1
+PBKDF2_ITERATIONS = int(os.environ['PBKDF2_ITERATIONS']) if 'PBKDF2_ITERATIONS' in os.environ else 260000
+PASSWORD_HASH_WORKERS = int(os.environ['PASSWORD_HASH_WORKERS']) if 'PASSWORD_HASH_WORKERS' in os.environ else 2
+PASSWORD_HASH_EXECUTOR = os.environ['PASSWORD_HASH_EXECUTOR'] if 'PASSWORD_HASH_EXECUTOR' in os.environ else 'thread'
+
+
+class Sha512Hasher:
+    name = 'sha512'
+
+    def encode(self, password: str, salt: str) -> str:
+        hasher = sha512()
+        hasher.update(password.encode('utf-8'))
+        hasher.update(salt.encode('ascii'))
+        return hasher.hexdigest()
+
+    def matches(self, password_hash: str) -> bool:
+        return '$' not in password_hash
+
+
+class Pbkdf2Hasher:
+    name = 'pbkdf2_sha256'
+
+    def __init__(self, iterations: int):
+        self.iterations = iterations
+
+    def encode(self, password: str, salt: str) -> str:
+        digest = pbkdf2_hmac(
+            'sha256', password.encode('utf-8'), salt.encode('ascii'), self.iterations
+        )
+        return f'{self.name}$i={self.iterations}${digest.hex()}'
+
+    def matches(self, password_hash: str) -> bool:
+        return password_hash.startswith(f'{self.name}$i={self.iterations}$')
+
+
+class ScryptHasher:
+    name = 'scrypt'
+
+    def __init__(self, n: int, r: int, p: int):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def encode(self, password: str, salt: str) -> str:
+        digest = scrypt(
+            password.encode('utf-8'), salt=salt.encode('ascii'),
+            n=self.n, r=self.r, p=self.p,
+            maxmem=256 * self.n * self.r * self.p + 2 ** 20
+        )
+        return f'{self.name}$n={self.n},r={self.r},p={self.p}${digest.hex()}'
+
+    def matches(self, password_hash: str) -> bool:
+        return password_hash.startswith(f'{self.name}$n={self.n},r={self.r},p={self.p}$')
+
+
+def parse_params(params: str) -> dict:
+    return {
+        key: int(value)
+        for key, value in (
+            param.split('=') for param in params.split(',')
+        )
+    }
+
+
+def hasher_for(password_hash: str):
+    if '$' not in password_hash:
+        return Sha512Hasher()
+    name, params, _ = password_hash.split('$')
+    params = parse_params(params)
+    if name == Pbkdf2Hasher.name:
+        return Pbkdf2Hasher(params['i'])
+    if name == ScryptHasher.name:
+        return ScryptHasher(params['n'], params['r'], params['p'])
+    raise ValueError(f'Unknown password hash algorithm: {name}')
+
+
+def make_hasher(name: str):
+    if name == ScryptHasher.name:
+        return ScryptHasher(SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if name == Pbkdf2Hasher.name:
+        return Pbkdf2Hasher(PBKDF2_ITERATIONS)
+    if name == Sha512Hasher.name:
+        return Sha512Hasher()
+    raise ValueError(f'Unknown password hash algorithm: {name}')
+
+
+hasher = make_hasher(PASSWORD_HASHER)
+
+
+def make_salt() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def make_password(password: str) -> Tuple[str, str]:
+    salt = make_salt()
+    return hasher.encode(password, salt), salt
+
+
+def check_password(
+    password: str,
+    password_hash: str,
+    password_salt: str
+) -> bool:
+    digest = hasher_for(password_hash).encode(password, password_salt)
+    return hmac.compare_digest(digest, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return not hasher.matches(password_hash)
+
+
+executor: Optional[Executor] = None
+
+
+def get_executor() -> Executor:
+    global executor
+    if executor is None:
+        if PASSWORD_HASH_EXECUTOR == 'process':
+            executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                thread_name_prefix='password-hash'
+            )
+    return executor
+
+
+async def make_password_async(password: str) -> Tuple[str, str]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), make_password, password)
+
+
+async def check_password_async(
+    password: str,
+    password_hash: str,
+    password_salt: str
+) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), check_password, password, password_hash, password_salt
+    )
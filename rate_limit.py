@@ -0,0 +1,250 @@
+from collections import OrderedDict, deque
+from math import ceil
+from threading import Lock
+from time import monotonic
+from typing import NamedTuple, Dict, Deque, Optional, Tuple
+import asyncio
+import os
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from metrics import route_name
+
+RATE_LIMIT_RATE = float(os.environ['RATE_LIMIT_RATE']) if 'RATE_LIMIT_RATE' in os.environ else 50
+RATE_LIMIT_BURST = float(os.environ['RATE_LIMIT_BURST']) if 'RATE_LIMIT_BURST' in os.environ else 100
+RATE_LIMIT_READ_RATE = float(os.environ['RATE_LIMIT_READ_RATE']) if 'RATE_LIMIT_READ_RATE' in os.environ else 20
+RATE_LIMIT_READ_BURST = float(os.environ['RATE_LIMIT_READ_BURST']) if 'RATE_LIMIT_READ_BURST' in os.environ else 60
+RATE_LIMITS = os.environ['RATE_LIMITS'] if 'RATE_LIMITS' in os.environ else ''
+RATE_LIMIT_URL = os.environ['RATE_LIMIT_URL'] if 'RATE_LIMIT_URL' in os.environ else None
+RATE_LIMIT_KEYS = int(os.environ['RATE_LIMIT_KEYS']) if 'RATE_LIMIT_KEYS' in os.environ else 100000
+RATE_LIMIT_TIMEOUT = float(os.environ['RATE_LIMIT_TIMEOUT']) if 'RATE_LIMIT_TIMEOUT' in os.environ else 0.05
+
+ADMISSION_LIMIT = int(os.environ['ADMISSION_LIMIT']) if 'ADMISSION_LIMIT' in os.environ else 64
+ADMISSION_QUEUE = int(os.environ['ADMISSION_QUEUE']) if 'ADMISSION_QUEUE' in os.environ else 64
+ADMISSION_TIMEOUT = float(os.environ['ADMISSION_TIMEOUT']) if 'ADMISSION_TIMEOUT' in os.environ else 1
+ADMISSION_RETRY_AFTER = int(os.environ['ADMISSION_RETRY_AFTER']) if 'ADMISSION_RETRY_AFTER' in os.environ else 1
+
+EXEMPT_ROUTES = {'read_metrics'}
+READ_ROUTES = {'read_topic', 'read_thread', 'read_batch', 'read_search'}
+LONG_LIVED_ROUTES = {'read_events'}
+
+
+class Limit(NamedTuple):
+    rate: float
+    burst: float
+
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    limits = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        route, value = item.split('=')
+        rate, burst = value.split('/')
+        limits[route.strip()] = Limit(float(rate), float(burst))
+    return limits
+
+
+DEFAULT_LIMIT = Limit(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+READ_LIMIT = Limit(RATE_LIMIT_READ_RATE, RATE_LIMIT_READ_BURST)
+ROUTE_LIMITS = {
+    'request_token': Limit(1, 10),
+    'create_user': Limit(0.1, 5),
+    **{route: READ_LIMIT for route in READ_ROUTES},
+    **parse_limits(RATE_LIMITS)
+}
+
+
+class LocalBucketStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self.lock = Lock()
+        self.failures = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        with self.lock:
+            now = monotonic()
+            tokens, updated = self.buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / limit.rate
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return wait
+
+
+TAKE_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+'''
+
+
+class RedisBucketStore:
+    def __init__(self, client, errors: Tuple[type, ...]):
+        self.client = client
+        self.script = client.register_script(TAKE_SCRIPT)
+        self.errors = errors
+        self.failures = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        try:
+            return float(await self.script(keys=[f'rate:{key}'], args=[limit.rate, limit.burst]))
+        except self.errors:
+            self.failures += 1
+            return 0.0
+
+
+def make_bucket_store():
+    if RATE_LIMIT_URL is not None:
+        import redis
+        import redis.asyncio
+        client = redis.asyncio.Redis.from_url(
+            RATE_LIMIT_URL, socket_timeout=RATE_LIMIT_TIMEOUT, socket_connect_timeout=RATE_LIMIT_TIMEOUT
+        )
+        return RedisBucketStore(client, (redis.RedisError, OSError, asyncio.TimeoutError))
+    return LocalBucketStore(RATE_LIMIT_KEYS)
+
+
+class RateLimiter:
+    def __init__(self, store, limits: Dict[str, Limit], default: Limit):
+        self.store = store
+        self.limits = limits
+        self.default = default
+        self.limited = 0
+
+    async def retry_after(self, kind: str, id, route: str) -> float:
+        limit = self.limits.get(route, self.default)
+        if limit.rate <= 0:
+            return 0.0
+        wait = await self.store.take(f'{kind}:{id}:{route}', limit)
+        if wait > 0:
+            self.limited += 1
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            'limited': self.limited,
+            'store_failures': self.store.failures
+        }
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return True
+        if len(self.waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        return True
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'waiting': len(self.waiters),
+            'rejected': self.rejected
+        }
+
+
+rate_limiter = RateLimiter(make_bucket_store(), ROUTE_LIMITS, DEFAULT_LIMIT)
+concurrency_limiter = ConcurrencyLimiter(ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {'Retry-After': str(max(1, ceil(seconds)))}
+
+
+def client_ip(scope: dict) -> Optional[str]:
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+def match_route(router, scope: dict):
+    for route in router.routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            scope.update(child_scope)
+            return
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        match_route(self.router, scope)
+        route = route_name(scope)
+        if route in EXEMPT_ROUTES:
+            return await self.app(scope, receive, send)
+        wait = await rate_limiter.retry_after('ip', client_ip(scope), route) if route in rate_limiter.limits else 0.0
+        if wait > 0:
+            response = JSONResponse(
+                {'detail': 'Too many requests'}, status_code=429, headers=retry_after_header(wait)
+            )
+            return await response(scope, receive, send)
+        if route in LONG_LIVED_ROUTES or concurrency_limiter.limit <= 0:
+            return await self.app(scope, receive, send)
+        if not await concurrency_limiter.acquire():
+            response = JSONResponse(
+                {'detail': 'Server is busy'}, status_code=503,
+                headers=retry_after_header(ADMISSION_RETRY_AFTER)
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency_limiter.release()
@@ -0,0 +1,153 @@
+from datetime import datetime
+from time import perf_counter
+from typing import Optional, List, Callable, Iterable, Iterator, Tuple
+import json
+
+from metrics import add_serialization
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ReadModel = dict
+
+
+def render_json(data) -> bytes:
+    started = perf_counter()
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(
+            data, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')
+        ).encode('utf-8')
+    add_serialization(perf_counter() - started)
+    return body
+
+
+def split_template(data: ReadModel, *keys: str) -> Tuple[bytes, ...]:
+    body = render_json(data)
+    parts = []
+    for key in keys:
+        marker = render_json(key) + b':[]'
+        head, body = body.split(marker, 1)
+        parts.append(head + marker[:-1])
+        body = marker[-1:] + body
+    parts.append(body)
+    return tuple(parts)
+
+
+def stream_array(mapper: Callable[..., ReadModel], rows: Iterable[tuple], chunk_rows: int = 500) -> Iterator[bytes]:
+    separator = b''
+    chunk = []
+    for row in rows:
+        chunk.append(render_json(mapper(*row)))
+        if len(chunk) >= chunk_rows:
+            yield separator + b','.join(chunk)
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + b','.join(chunk)
+
+
+def user(user_id: Optional[int], name: Optional[str]) -> Optional[ReadModel]:
+    if user_id is None:
+        return None
+    return {'id': user_id, 'name': name}
+
+
+def path_element(id: int, title: Optional[str]) -> ReadModel:
+    return {'id': id, 'title': title}
+
+
+def timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def topic_data(title, id, num_topics, num_threads, last_post_at, user_id, user_name) -> ReadModel:
+    return {
+        'title': title,
+        'link': id,
+        'numTopics': num_topics,
+        'numThreads': num_threads,
+        'lastPost': timestamp(last_post_at),
+        'user': user(user_id, user_name)
+    }
+
+
+def thread_data(title, id, num_posts, last_post_at, is_vegan, user_id, user_name) -> ReadModel:
+    return {
+        'title': title,
+        'link': id,
+        'numPosts': num_posts,
+        'lastPost': timestamp(last_post_at),
+        'isVegan': bool(is_vegan),
+        'user': user(user_id, user_name)
+    }
+
+
+def post_data(id, text, user_id, user_name) -> ReadModel:
+    return {
+        'user': user(user_id, user_name),
+        'text': text,
+        'id': id
+    }
+
+
+def search_result(link, title, post_id, snippet, user_id, user_name) -> ReadModel:
+    return {
+        'link': link,
+        'title': title,
+        'post': post_id,
+        'snippet': snippet,
+        'user': user(user_id, user_name)
+    }
+
+
+def topic(
+        title: Optional[str], topics: List[ReadModel], threads: List[ReadModel],
+        owner: Optional[ReadModel], path: List[ReadModel]
+) -> ReadModel:
+    return {
+        'title': title,
+        'topics': topics,
+        'threads': threads,
+        'user': owner,
+        'path': path
+    }
+
+
+def thread(title: Optional[str], posts: List[ReadModel], path: List[ReadModel]) -> ReadModel:
+    return {
+        'title': title,
+        'posts': posts,
+        'path': path
+    }
+
+
+def topic_response(data: ReadModel) -> ReadModel:
+    return {'type': 'topic', 'data': data}
+
+
+def thread_response(data: ReadModel, next_cursor: Optional[int]) -> ReadModel:
+    return {'type': 'thread', 'data': data, 'nextCursor': next_cursor}
+
+
+def batch_response(topics: List[ReadModel], threads: List[ReadModel]) -> ReadModel:
+    return {'type': 'batch', 'data': {'topics': topics, 'threads': threads}}
+
+
+def search_response(results: List[ReadModel], next_offset: Optional[int]) -> ReadModel:
+    return {'type': 'search', 'data': results, 'nextOffset': next_offset}
+
+
+def post_added(thread_id: int, post: ReadModel) -> ReadModel:
+    return {'type': 'post', 'thread': thread_id, 'data': post}
+
+
+def post_removed(thread_id: int, post_id: int) -> ReadModel:
+    return {'type': 'delete', 'thread': thread_id, 'id': post_id}
+
+
+def closed() -> ReadModel:
+    return {'type': 'closed'}
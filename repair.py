@@ -0,0 +1,9 @@
+from db_definitions import DBSession, use_primary
+from db_interactions import repair_counters
+
+session = DBSession()
+use_primary(session)
+try:
+    repair_counters(session)
+finally:
+    session.close()
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import Optional, NamedTuple, Dict, Set, Tuple, Hashable
+import os
+
+from compression import compress
+from db_definitions import REPLICA_URLS
+from utils import WEB_CONCURRENCY
+
+RESPONSE_CACHE_BYTES = int(os.environ['RESPONSE_CACHE_BYTES']) if 'RESPONSE_CACHE_BYTES' in os.environ else 64 * 2 ** 20
+RESPONSE_CACHE_REVALIDATE = float(os.environ['RESPONSE_CACHE_REVALIDATE']) if 'RESPONSE_CACHE_REVALIDATE' in os.environ \
+    else inf if WEB_CONCURRENCY == 1 and not REPLICA_URLS else 1.0
+
+Group = Tuple[str, int]
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    encodings: Dict[str, bytes]
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, revalidate: float):
+        self.max_bytes = max_bytes
+        self.revalidate = revalidate
+        self.entries: 'OrderedDict[Hashable, CachedResponse]' = OrderedDict()
+        self.checked_at: Dict[Hashable, float] = {}
+        self.groups: Dict[Group, Set[Hashable]] = {}
+        self.generations: Dict[Group, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.compressions = 0
+        self.revalidations = 0
+        self.lock = Lock()
+
+    def get(self, group: Group, key: Hashable) -> Optional[CachedResponse]:
+        with self.lock:
+            entry = self.entries.get((group, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end((group, key))
+            return entry
+
+    def is_fresh(self, group: Group, key: Hashable, entry: CachedResponse) -> bool:
+        with self.lock:
+            return self.entries.get((group, key)) is entry \
+                and monotonic() - self.checked_at[(group, key)] < self.revalidate
+
+    def revalidated(self, group: Group, key: Hashable, entry: CachedResponse):
+        with self.lock:
+            if self.entries.get((group, key)) is entry:
+                self.checked_at[(group, key)] = monotonic()
+                self.revalidations += 1
+
+    def generation(self, group: Group) -> int:
+        with self.lock:
+            return self.generations.get(group, 0)
+
+    def set(self, group: Group, key: Hashable, entry: CachedResponse, generation: int):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if self.generations.get(group, 0) != generation:
+                return
+            if (group, key) in self.entries:
+                self._remove((group, key))
+            self.entries[(group, key)] = entry
+            self.checked_at[(group, key)] = monotonic()
+            self.groups.setdefault(group, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def encode(self, group: Group, key: Hashable, entry: CachedResponse, encoding: str) -> bytes:
+        body = entry.encodings.get(encoding)
+        if body is not None:
+            return body
+        body = compress(entry.body, encoding)
+        with self.lock:
+            if self.entries.get((group, key)) is entry and encoding not in entry.encodings:
+                entry.encodings[encoding] = body
+                self.size += len(body)
+                self.compressions += 1
+                while self.size > self.max_bytes:
+                    self._remove(next(iter(self.entries)))
+                    self.evictions += 1
+        return body
+
+    def invalidate(self, group: Group):
+        with self.lock:
+            self.generations[group] = self.generations.get(group, 0) + 1
+            for key in list(self.groups.get(group, ())):
+                self._remove((group, key))
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'compressions': self.compressions,
+                'revalidations': self.revalidations
+            }
+
+    def _remove(self, entry_key: Tuple[Group, Hashable]):
+        group, key = entry_key
+        entry = self.entries.pop(entry_key)
+        del self.checked_at[entry_key]
+        self.size -= len(entry.body) + sum(len(body) for body in entry.encodings.values())
+        keys = self.groups[group]
+        keys.discard(key)
+        if not keys:
+            del self.groups[group]
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES, RESPONSE_CACHE_REVALIDATE)
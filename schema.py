@@ -39,6 +39,7 @@ class DBUser(BaseModel):
     password_salt: str
     token: Optional[str]
     token_expires_at: Optional[datetime]
+    token_generation: int = 0
 
     class Config:
         orm_mode = True
@@ -106,6 +107,40 @@ class Thread(BaseModel):
 class ThreadResponse(BaseModel):
     type: Literal['thread'] = 'thread'
     data: Thread
+    nextCursor: Optional[int] = None
+
+
+class SearchResult(BaseModel):
+    link: int
+    title: Optional[str]
+    post: Optional[int]
+    snippet: Optional[str]
+    user: Optional[User]
+
+
+class SearchResponse(BaseModel):
+    type: Literal['search'] = 'search'
+    data: List[SearchResult]
+    nextOffset: Optional[int] = None
+
+
+class BatchData(BaseModel):
+    topics: List[Optional[TopicResponse]]
+    threads: List[Optional[ThreadResponse]]
+
+
+class BatchResponse(BaseModel):
+    type: Literal['batch'] = 'batch'
+    data: BatchData
+
+
+class NewPost(BaseModel):
+    threadId: int
+    text: str
+
+
+class PostBatch(BaseModel):
+    posts: List[NewPost]
 
 
 class TokenResponse(BaseModel):
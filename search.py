@@ -0,0 +1,149 @@
+from typing import Literal, List, Dict
+import os
+import re
+
+from db_definitions import Post, Thread
+
+from sqlalchemy import text, select, insert, func, literal, literal_column, table, column
+from sqlalchemy.sql import TableClause
+from sqlalchemy.orm import Session
+
+SEARCH_CONFIG = os.environ['SEARCH_CONFIG'] if 'SEARCH_CONFIG' in os.environ else 'english'
+SEARCH_PAGE_SIZE = int(os.environ['SEARCH_PAGE_SIZE']) if 'SEARCH_PAGE_SIZE' in os.environ else 20
+SEARCH_MAX_PAGE_SIZE = int(os.environ['SEARCH_MAX_PAGE_SIZE']) if 'SEARCH_MAX_PAGE_SIZE' in os.environ else 100
+SNIPPET_WORDS = 16
+
+Searchable = Literal[Post, Thread]
+
+FTS_TABLES = {
+    Post: ('posts_fts', 'text'),
+    Thread: ('threads_fts', 'title')
+}
+
+
+def dialect_name(session: Session) -> str:
+    return session.get_bind().dialect.name
+
+
+def fts_table(model: Searchable) -> TableClause:
+    name, field = FTS_TABLES[model]
+    return table(name, column('rowid'), column(field), column(name), column('rank'))
+
+
+def fts_query(query: str) -> str:
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+def search_config():
+    return literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+
+
+def search_vector(model: Searchable):
+    _, field = FTS_TABLES[model]
+    return func.to_tsvector(search_config(), func.coalesce(getattr(model, field), ''))
+
+
+def create_search_index(session: Session):
+    dialect = dialect_name(session)
+    if dialect == 'sqlite':
+        existing = set(session.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table'")
+        ).scalars())
+        for model, (name, field) in FTS_TABLES.items():
+            if name in existing:
+                continue
+            session.execute(text(
+                f"CREATE VIRTUAL TABLE {name} USING fts5"
+                f"({field}, content='{model.__tablename__}', content_rowid='id')"
+            ))
+            session.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for model, (_, field) in FTS_TABLES.items():
+            session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{model.__tablename__}_search ON {model.__tablename__} "
+                f"USING gin (to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce({field}, '')))"
+            ))
+    session.commit()
+
+
+def rebuild_search_index(session: Session):
+    if dialect_name(session) != 'sqlite':
+        return
+    for name, _ in FTS_TABLES.values():
+        session.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+    session.commit()
+
+
+def index_rows(session: Session, model: Searchable, condition):
+    if dialect_name(session) != 'sqlite':
+        return
+    _, field = FTS_TABLES[model]
+    session.execute(
+        insert(fts_table(model)).from_select(
+            ['rowid', field],
+            select(model.id, getattr(model, field)).where(condition)
+        )
+    )
+
+
+def unindex_rows(session: Session, model: Searchable, condition):
+    if dialect_name(session) != 'sqlite':
+        return
+    name, field = FTS_TABLES[model]
+    session.execute(
+        insert(fts_table(model)).from_select(
+            [name, 'rowid', field],
+            select(literal('delete'), model.id, getattr(model, field)).where(condition)
+        )
+    )
+
+
+def find(session: Session, model: Searchable, query: str, scope, offset: int, limit: int) -> List[int]:
+    dialect = dialect_name(session)
+    name, field = FTS_TABLES[model]
+    if dialect == 'sqlite':
+        match = fts_query(query)
+        if not match:
+            return []
+        fts = fts_table(model)
+        statement = select(model.id)\
+            .select_from(fts.join(model, model.id == fts.c.rowid))\
+            .where(fts.c[name].op('MATCH')(match))\
+            .order_by(fts.c.rank, model.id.desc())
+    elif dialect == 'postgresql':
+        ts_query = func.plainto_tsquery(search_config(), query)
+        statement = select(model.id)\
+            .where(search_vector(model).op('@@')(ts_query))\
+            .order_by(func.ts_rank(search_vector(model), ts_query).desc(), model.id.desc())
+    else:
+        statement = select(model.id)\
+            .where(getattr(model, field).ilike(f'%{query}%'))\
+            .order_by(model.id.desc())
+    if scope is not None:
+        statement = statement.where(scope)
+    return session.execute(statement.offset(offset).limit(limit)).scalars().all()
+
+
+def snippets(session: Session, model: Searchable, query: str, ids: List[int]) -> Dict[int, str]:
+    dialect = dialect_name(session)
+    name, field = FTS_TABLES[model]
+    if dialect == 'sqlite':
+        fts = fts_table(model)
+        statement = select(
+            fts.c.rowid,
+            func.snippet(literal_column(name), 0, '', '', '...', SNIPPET_WORDS)
+        )\
+            .where(fts.c[name].op('MATCH')(fts_query(query)))\
+            .where(fts.c.rowid.in_(ids))
+    elif dialect == 'postgresql':
+        statement = select(
+            model.id,
+            func.ts_headline(
+                search_config(), getattr(model, field),
+                func.plainto_tsquery(search_config(), query),
+                f'StartSel="",StopSel="",MaxWords={SNIPPET_WORDS},MinWords={SNIPPET_WORDS // 2}'
+            )
+        ).where(model.id.in_(ids))
+    else:
+        statement = select(model.id, getattr(model, field)).where(model.id.in_(ids))
+    return dict(session.execute(statement).all())
@@ -0,0 +1,63 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from hashlib import sha256
+from typing import Optional, NamedTuple
+import binascii
+import hmac
+import json
+import os
+
+from utils import WEB_CONCURRENCY
+
+TOKEN_MODE = os.environ['TOKEN_MODE'] if 'TOKEN_MODE' in os.environ else 'opaque'
+SIGNED_TOKENS = TOKEN_MODE == 'signed'
+TOKEN_SECRET = os.environ['TOKEN_SECRET'].encode('utf-8') if 'TOKEN_SECRET' in os.environ else None
+
+
+class TokenClaims(NamedTuple):
+    user_id: int
+    name: str
+    generation: int
+    expires_at: datetime
+
+
+def check_token_settings(token_cache_url: Optional[str]):
+    if TOKEN_SECRET is None:
+        raise RuntimeError('TOKEN_MODE=signed needs TOKEN_SECRET, shared by every worker.')
+    if token_cache_url is None and WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            'TOKEN_MODE=signed with several workers needs TOKEN_CACHE_URL, '
+            'so password changes revoke tokens in every worker.'
+        )
+
+
+def encode(data: bytes) -> str:
+    return urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def decode(data: str) -> bytes:
+    return urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def sign(body: str) -> str:
+    return encode(hmac.new(TOKEN_SECRET, body.encode('utf-8'), sha256).digest())
+
+
+def make_signed_token(claims: TokenClaims) -> str:
+    payload = json.dumps(
+        [claims.user_id, claims.name, claims.generation, claims.expires_at.timestamp()],
+        separators=(',', ':')
+    )
+    body = encode(payload.encode('utf-8'))
+    return f'{body}.{sign(body)}'
+
+
+def read_signed_token(token: str) -> Optional[TokenClaims]:
+    body, _, signature = token.partition('.')
+    if not hmac.compare_digest(sign(body).encode('ascii'), signature.encode('utf-8')):
+        return None
+    try:
+        user_id, name, generation, expires_at = json.loads(decode(body))
+    except (ValueError, binascii.Error):
+        return None
+    return TokenClaims(user_id, name, generation, datetime.fromtimestamp(expires_at))
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(DIRECTORY, "test.sqlite")}'
+os.environ['SCRYPT_N'] = '2'
+os.environ['RATE_LIMIT_RATE'] = '0'
+os.environ['RATE_LIMIT_READ_RATE'] = '0'
+os.environ['RATE_LIMITS'] = 'request_token=0/0,create_user=0/0'
+os.environ.pop('TOKEN_MODE', None)
+os.environ.pop('REPLICA_URLS', None)
+
+import pytest
+from sqlalchemy import event, text
+
+from db_definitions import Base, DBSession, engine, stickiness, use_primary
+from migrations import migrate
+
+
+def reset_database():
+    with engine.begin() as connection:
+        for name in ('posts_fts', 'threads_fts'):
+            connection.execute(text(f'DROP TABLE IF EXISTS {name}'))
+    Base.metadata.drop_all(engine)
+    migrate(engine)
+
+
+reset_database()
+
+
+@pytest.fixture
+def db():
+    from response_cache import response_cache
+    from token_cache import token_cache
+    reset_database()
+    response_cache.__init__(response_cache.max_bytes, response_cache.revalidate)
+    token_cache.__init__(token_cache.max_size, token_cache.ttl)
+    stickiness.until.clear()
+    yield
+
+
+@pytest.fixture
+def session(db):
+    session = DBSession()
+    use_primary(session)
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db):
+    from starlette.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
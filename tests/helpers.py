@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from db_definitions import User, Topic, Thread, Post
+from passwords import make_password
+import db_interactions
+import schema
+
+
+def make_user(session: Session, name: str, password: str = 'Password1') -> int:
+    db_interactions.add_user(session, name, *make_password(password))
+    return session.query(User.id).filter(User.name == name).scalar()
+
+
+def make_topic(session: Session, title: str, user_id: int, parent_id: int = 0) -> int:
+    assert db_interactions.add_topic(session, title, parent_id, user_id)
+    return session.query(func.max(Topic.id)).scalar()
+
+
+def make_thread(session: Session, title: str, user_id: int, parent_id: int = 0) -> int:
+    assert db_interactions.add_thread(session, title, False, parent_id, user_id)
+    return session.query(func.max(Thread.id)).scalar()
+
+
+def make_post(session: Session, text: str, user_id: int, thread_id: int) -> int:
+    assert db_interactions.add_post(session, thread_id, schema.User(id=user_id, name=''), text)
+    return session.query(func.max(Post.id)).scalar()
+
+
+def counters(session: Session) -> Dict[str, list]:
+    session.expire_all()
+    return {
+        'topics': session.query(
+            Topic.id, Topic.num_topics, Topic.num_threads, Topic.num_posts,
+            Topic.last_post_id, Topic.last_post_at, Topic.last_post_user_id
+        ).order_by(Topic.id).all(),
+        'threads': session.query(
+            Thread.id, Thread.num_posts, Thread.last_post_id, Thread.last_post_at, Thread.last_post_user_id
+        ).order_by(Thread.id).all()
+    }
+
+
+def login(client, name: str, password: str = 'Password1') -> Dict[str, str]:
+    response = client.post('/api/authenticate', data={'username': name, 'password': password})
+    assert response.status_code == 200, response.text
+    return {'Authorization': 'Bearer ' + response.json()['access_token']}
+
+
+class FakeRedis:
+    def __init__(self):
+        self.now = 0.0
+        self.values: Dict[str, object] = {}
+        self.expires: Dict[str, float] = {}
+        self.calls: List[Tuple[str, str]] = []
+
+    def _live(self, key: str) -> bool:
+        if key in self.expires and self.expires[key] <= self.now:
+            del self.values[key]
+            del self.expires[key]
+        return key in self.values
+
+    def get(self, key: str) -> Optional[bytes]:
+        self.calls.append(('get', key))
+        if not self._live(key):
+            return None
+        return str(self.values[key]).encode('utf-8')
+
+    def set(self, key: str, value):
+        self.calls.append(('set', key))
+        self.values[key] = value
+        self.expires.pop(key, None)
+
+    def setex(self, key: str, seconds: int, value):
+        self.calls.append(('setex', key))
+        self.values[key] = value
+        self.expires[key] = self.now + seconds
+
+    def sadd(self, key: str, *members: str):
+        self.calls.append(('sadd', key))
+        if not self._live(key):
+            self.values[key] = set()
+        self.values[key].update(members)
+
+    def smembers(self, key: str):
+        self.calls.append(('smembers', key))
+        if not self._live(key):
+            return set()
+        return {member.encode('ascii') for member in self.values[key]}
+
+    def expire(self, key: str, seconds: int):
+        self.calls.append(('expire', key))
+        if self._live(key):
+            self.expires[key] = self.now + seconds
+
+    def delete(self, *keys: str):
+        self.calls.append(('delete', ','.join(keys)))
+        for key in keys:
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db_definitions import Topic, async_url, engine, engines, make_engine
+from db_interactions import add_topic, get_topic
+import main
+from helpers import make_user
+
+
+@pytest.fixture
+def async_engine(db):
+    async_engine = make_engine('test_async', str(engine.url), is_async=True)
+    yield async_engine
+    engines.pop('test_async')
+    asyncio.run(async_engine.dispose())
+
+
+def test_async_urls():
+    assert async_url('postgres://u@h/db') == 'postgresql+asyncpg://u@h/db'
+    assert async_url('sqlite:///db.sqlite') == 'sqlite+aiosqlite:///db.sqlite'
+
+
+def test_run_db_reads_and_writes_through_async_session(async_engine, session):
+    user_id = make_user(session, 'alice')
+
+    async def scenario():
+        async with AsyncSession(async_engine) as db:
+            assert await main.run_db(db, add_topic, 'async topic', 0, user_id)
+        async with AsyncSession(async_engine) as db:
+            return await main.run_db(db, get_topic, 0)
+
+    topic = asyncio.run(scenario())
+    assert [child['title'] for child in topic['topics']] == ['async topic']
+    session.expire_all()
+    assert topic == get_topic(session, 0)
+    assert session.query(Topic).count() == 2
@@ -0,0 +1,53 @@
+import main
+from response_cache import response_cache
+from helpers import make_user, make_topic, make_thread, make_post
+
+
+def test_batch_matches_single_reads_in_request_order(client, session):
+    user_id = make_user(session, 'alice')
+    topic_id = make_topic(session, 'topic', user_id)
+    thread_id = make_thread(session, 'thread', user_id, topic_id)
+    for n in range(5):
+        make_post(session, f'post {n}', user_id, thread_id)
+    cursor = client.get(f'/api/thread/{thread_id}', params={'limit': 2}).json()['nextCursor']
+    response = client.get('/api/batch', params=[
+        ('topic_id', topic_id), ('topic_id', 999), ('topic_id', 0),
+        ('thread', f'{thread_id}:{cursor}'), ('thread', '999'), ('thread', str(thread_id)), ('limit', 2),
+    ])
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert data['topics'] == [
+        client.get(f'/api/topic/{topic_id}').json(), None, client.get('/api/topic/0').json()
+    ]
+    assert data['threads'] == [
+        client.get(f'/api/thread/{thread_id}', params={'cursor': cursor, 'limit': 2}).json(), None,
+        client.get(f'/api/thread/{thread_id}', params={'limit': 2}).json(),
+    ]
+
+
+def test_batch_query_count_does_not_grow_with_items(client, session, statements):
+    user_id = make_user(session, 'alice')
+    topic_ids = [make_topic(session, f'topic {n}', user_id) for n in range(6)]
+    thread_ids = [make_thread(session, f'thread {n}', user_id) for n in range(6)]
+
+    def count(n: int) -> int:
+        response_cache.__init__(response_cache.max_bytes, response_cache.revalidate)
+        statements.clear()
+        client.get('/api/batch', params=[('topic_id', id) for id in topic_ids[:n]] + [
+            ('thread', str(id)) for id in thread_ids[:n]
+        ])
+        return len(statements)
+
+    assert count(2) == count(6)
+
+
+def test_batch_rejects_oversized_and_malformed_requests(client, monkeypatch):
+    monkeypatch.setattr(main, 'READ_BATCH_MAX_SIZE', 2)
+    assert client.get('/api/batch', params=[('topic_id', 0), ('topic_id', 0)]).status_code == 200
+    assert client.get('/api/batch', params=[('topic_id', 0), ('thread', '1'), ('thread', '2')]).status_code == 400
+    for ref in ('x', '1:y', ''):
+        assert client.get('/api/batch', params={'thread': ref}).status_code == 400
+
+
+def test_empty_batch(client):
+    assert client.get('/api/batch').json()['data'] == {'topics': [], 'threads': []}
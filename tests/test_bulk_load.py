@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+import bulk_load
+from db_definitions import Post, Thread, Topic, User
+from helpers import counters, login
+from db_interactions import repair_counters
+
+ARGS = ['--depth', '2', '--fanout', '2', '--threads', '2', '--posts', '3', '--users', '3', '--chunk-size', '4']
+
+
+def run(monkeypatch, *extra: str):
+    monkeypatch.setattr(sys, 'argv', ['bulk_load.py', *ARGS, *extra])
+    bulk_load.main()
+
+
+def test_rows_are_deterministic():
+    args = argparse.Namespace(depth=2, fanout=2, threads=2, posts=3, users=3, seed='7')
+    assert list(bulk_load.make_posts(args, 1, 1, 1)) == list(bulk_load.make_posts(args, 1, 1, 1))
+    assert list(bulk_load.make_posts(args, 1, 1, 1)) != list(bulk_load.make_posts(
+        argparse.Namespace(**{**vars(args), 'seed': '8'}), 1, 1, 1
+    ))
+
+
+def test_loader_builds_a_consistent_forum(client, session, monkeypatch):
+    run(monkeypatch)
+    run(monkeypatch, '--seed', '1')
+    assert session.query(User).count() == 1 + 6
+    assert session.query(Topic).count() == 1 + 2 * 6
+    assert session.query(Thread).count() == 2 * 14
+    assert session.query(Post).count() == 3 * 28
+    assert session.query(Topic.parent_id).filter(Topic.id == 8).scalar() == 0
+    before = counters(session)
+    repair_counters(session)
+    assert counters(session) == before
+    assert client.get('/api/search', params={'q': 'lorem'}).json()['data']
+    name = session.query(User.name).order_by(User.id.desc()).limit(1).scalar()
+    login(client, name)
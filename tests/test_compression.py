@@ -0,0 +1,64 @@
+import gzip
+
+import pytest
+
+import compression
+from compression import negotiate, compress_stream, weak_etag
+from response_cache import response_cache
+from helpers import make_user, make_thread, make_post
+
+
+def test_negotiate_prefers_highest_weight(monkeypatch):
+    monkeypatch.setattr(compression, 'codecs', {'br': None, 'gzip': None})
+    assert negotiate(None) is None
+    assert negotiate('identity') is None
+    assert negotiate('gzip, br') == 'br'
+    assert negotiate('gzip;q=1.0, br;q=0.5') == 'gzip'
+    assert negotiate('br;q=0, *') == 'gzip'
+    assert negotiate('gzip;q=bogus') is None
+
+
+def test_compress_stream_round_trips():
+    chunks = [b'{"a":', b'"' + b'x' * 5000 + b'"', b'}']
+    assert gzip.decompress(b''.join(compress_stream(iter(chunks), 'gzip'))) == b''.join(chunks)
+
+
+def test_weak_etag():
+    assert weak_etag('"e"') == 'W/"e"'
+    assert weak_etag('W/"e"') == 'W/"e"'
+
+
+@pytest.fixture
+def thread_id(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    for n in range(30):
+        make_post(session, f'post number {n} ' + 'lorem ipsum ' * 10, user_id, thread_id)
+    return thread_id
+
+
+def test_large_bodies_are_compressed_with_weak_etag(client, thread_id):
+    plain = client.get(f'/api/thread/{thread_id}', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+    compressed = client.get(f'/api/thread/{thread_id}', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert compressed.headers['ETag'] == weak_etag(plain.headers['ETag'])
+    assert compressed.content == plain.content
+    revalidated = client.get(f'/api/thread/{thread_id}', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']
+    })
+    assert revalidated.status_code == 304
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = client.get('/api/topic/0', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert not response.headers['ETag'].startswith('W/')
+
+
+def test_cached_entries_keep_their_encodings(client, thread_id):
+    for _ in range(3):
+        client.get(f'/api/thread/{thread_id}', headers={'Accept-Encoding': 'gzip'})
+    assert response_cache.stats()['compressions'] == 1
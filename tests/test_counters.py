@@ -0,0 +1,58 @@
+import random
+
+from db_definitions import Post, Thread, Topic
+from db_interactions import add_posts, remove_post, remove_thread, remove_topic, repair_counters
+from helpers import make_user, make_topic, make_thread, make_post, counters
+
+
+ACTIONS = ['topic'] * 2 + ['thread'] * 3 + ['post'] * 5 + ['batch'] * 2 + ['remove_post', 'remove_thread', 'remove_topic']
+
+
+def assert_matches_repair(session):
+    before = counters(session)
+    repair_counters(session)
+    assert counters(session) == before
+
+
+def test_counters_follow_every_write(session):
+    rng = random.Random(13)
+    users = [make_user(session, name) for name in ('alice', 'bob')]
+    topics = [0]
+    for step in range(100):
+        user_id = rng.choice(users)
+        threads = [id for id, in session.query(Thread.id)]
+        posts = session.query(Post.id, Post.user_id).all()
+        action = rng.choice(ACTIONS)
+        if action == 'topic':
+            topics.append(make_topic(session, f'topic {step}', user_id, rng.choice(topics)))
+        elif action == 'thread':
+            make_thread(session, f'thread {step}', user_id, rng.choice(topics))
+        elif action == 'post' and threads:
+            make_post(session, f'post {step}', user_id, rng.choice(threads))
+        elif action == 'batch' and threads:
+            add_posts(session, [(rng.choice(threads), user_id, f'batch {step} {n}') for n in range(3)])
+        elif action == 'remove_post' and posts:
+            post_id, owner = rng.choice(posts)
+            assert remove_post(session, post_id, owner)
+        elif action == 'remove_thread' and threads:
+            thread_id = rng.choice(threads)
+            owner = session.query(Thread.user_id).filter(Thread.id == thread_id).scalar()
+            assert remove_thread(session, thread_id, owner)
+        elif action == 'remove_topic' and len(topics) > 1:
+            topic_id = rng.choice(topics[1:])
+            owner = session.query(Topic.user_id).filter(Topic.id == topic_id).scalar()
+            assert remove_topic(session, topic_id, owner)
+            topics = [0] + [id for id, in session.query(Topic.id).filter(Topic.id != 0)]
+        assert_matches_repair(session)
+
+
+def test_repair_fixes_drifted_counters(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    make_post(session, 'post', user_id, thread_id)
+    expected = counters(session)
+    session.query(Thread).update({Thread.num_posts: 42, Thread.last_post_id: None})
+    session.query(Topic).update({Topic.num_threads: 0})
+    session.commit()
+    repair_counters(session)
+    assert counters(session) == expected
@@ -0,0 +1,44 @@
+from main import etag_matches
+from helpers import make_user, make_thread, make_post, login
+
+
+def test_etag_matching():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('"b", W/"a"', '"a"')
+    assert etag_matches('*', '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+
+def test_conditional_topic_read(client, session):
+    user_id = make_user(session, 'alice')
+    response = client.get('/api/topic/0')
+    etag = response.headers['ETag']
+    not_modified = client.get('/api/topic/0', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304 and not_modified.content == b''
+    assert not_modified.headers['ETag'] == etag
+    make_thread(session, 'thread', user_id)
+    changed = client.get('/api/topic/0', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_thread_etag_depends_on_page(client, session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    first = make_post(session, 'first', user_id, thread_id)
+    etags = {
+        client.get(f'/api/thread/{thread_id}', params=params).headers['ETag']
+        for params in ({}, {'limit': 1}, {'cursor': first})
+    }
+    assert len(etags) == 3
+
+
+def test_post_changes_thread_etag(client, session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    etag = client.get(f'/api/thread/{thread_id}').headers['ETag']
+    headers = login(client, 'alice')
+    assert client.post('/api/message', data={'thread_id': thread_id, 'message': 'hi'}, headers=headers).status_code == 204
+    response = client.get(f'/api/thread/{thread_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [post['text'] for post in response.json()['data']['posts']] == ['hi']
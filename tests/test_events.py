@@ -0,0 +1,124 @@
+import asyncio
+import queue
+
+import events
+from events import LocalBroker, RedisBroker, RESET
+import main
+
+
+async def next_event(subscriber, timeout: float = 1):
+    return await asyncio.wait_for(subscriber.__anext__(), timeout)
+
+
+def test_subscriber_receives_channel_events():
+    async def scenario():
+        broker = LocalBroker(8)
+        subscriber = broker.subscribe(('thread', 1))
+        assert broker.wants(('thread', 1)) and not broker.wants(('thread', 2))
+        broker.publish(('thread', 2), {'type': 'post', 'n': 0})
+        broker.publish(('thread', 1), {'type': 'post', 'n': 1})
+        event = await next_event(subscriber)
+        await subscriber.aclose()
+        return event, broker.stats()
+
+    event, stats = asyncio.run(scenario())
+    assert event == {'type': 'post', 'n': 1}
+    assert stats == {'channels': 0, 'subscribers': 0, 'published': 2, 'delivered': 1}
+
+
+def test_overflow_drops_backlog_and_sends_reset():
+    async def scenario():
+        broker = LocalBroker(2)
+        subscriber = broker.subscribe(('thread', 1))
+        for n in range(3):
+            broker.publish(('thread', 1), {'type': 'post', 'n': n})
+        broker.publish(('thread', 1), {'type': 'post', 'n': 3})
+        await asyncio.sleep(0)
+        received = [await next_event(subscriber), await next_event(subscriber)]
+        await subscriber.aclose()
+        return received
+
+    assert asyncio.run(scenario()) == [RESET, {'type': 'post', 'n': 3}]
+
+
+def test_heartbeat_yields_none(monkeypatch):
+    monkeypatch.setattr(events, 'EVENT_HEARTBEAT', 0.01)
+
+    async def scenario():
+        subscriber = LocalBroker(2).subscribe(('topic', 1))
+        event = await next_event(subscriber)
+        await subscriber.aclose()
+        return event
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_event_stream_subscribes_before_announcing(monkeypatch):
+    broker = LocalBroker(8)
+    monkeypatch.setattr(main, 'broker', broker)
+
+    async def scenario():
+        stream = main.event_stream(('thread', 1))
+        first = await stream.__anext__()
+        subscribers = broker.stats()['subscribers']
+        broker.publish(('thread', 1), {'type': 'closed'})
+        chunks = [chunk async for chunk in stream]
+        return first, subscribers, chunks
+
+    first, subscribers, chunks = asyncio.run(scenario())
+    assert first == b': subscribed\n\n'
+    assert subscribers == 1
+    assert chunks == [b'event: closed\ndata: {"type":"closed"}\n\n']
+    assert broker.stats()['subscribers'] == 0
+
+
+class FakePubSub:
+    def __init__(self, client):
+        self.client = client
+
+    def psubscribe(self, pattern: str):
+        if self.client.failures:
+            self.client.failures -= 1
+            raise ConnectionError('connection refused')
+
+    def listen(self):
+        while True:
+            message = self.client.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+
+class FakeClient:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.messages: 'queue.Queue' = queue.Queue()
+
+    def pubsub(self, ignore_subscribe_messages: bool):
+        return FakePubSub(self)
+
+    def send(self, channel: str, data: bytes):
+        self.messages.put({'channel': channel.encode('ascii'), 'data': data})
+
+
+def test_redis_listener_reconnects_and_resets_subscribers(monkeypatch):
+    monkeypatch.setattr(events, 'EVENT_RECONNECT_MIN', 0.01)
+    client = FakeClient(failures=0)
+
+    async def scenario():
+        broker = RedisBroker(client, (ConnectionError,), 8)
+        subscriber = broker.subscribe(('thread', 1))
+        client.send('events:thread:1', b'{"type":"post"}')
+        first = await next_event(subscriber)
+        client.send('events:thread:x', b'{}')
+        client.failures = 1
+        client.messages.put(ConnectionError('connection reset'))
+        second = await next_event(subscriber)
+        client.send('events:thread:1', b'{"type":"delete"}')
+        third = await next_event(subscriber)
+        await subscriber.aclose()
+        return [first, second, third], broker.stats()['reconnects']
+
+    received, reconnects = asyncio.run(scenario())
+    assert received == [{'type': 'post'}, RESET, {'type': 'delete'}]
+    assert reconnects == 2
@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+
+import main
+import metrics
+from metrics import Histogram, Registry, RequestMetrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    monkeypatch.setattr(main, 'registry', registry)
+    return registry
+
+
+def sample(text: str, name: str) -> float:
+    [line] = [line for line in text.splitlines() if line.startswith(name + ' ')]
+    return float(line.rsplit(' ', 1)[1])
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 2, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 3]
+    assert (histogram.count, histogram.total) == (4, 15.5)
+
+
+def test_render_exposes_every_series():
+    registry = Registry()
+    request = RequestMetrics(False)
+    request.queries, request.rows, request.db_seconds = 3, 7, 0.25
+    registry.record('read_topic', 200, 0.003, request)
+    text = registry.render()
+    assert sample(text, 'forum_request_duration_seconds_bucket{route="read_topic",le="0.0025"}') == 0
+    assert sample(text, 'forum_request_duration_seconds_bucket{route="read_topic",le="0.005"}') == 1
+    assert sample(text, 'forum_request_queries_bucket{route="read_topic",le="3"}') == 1
+    assert sample(text, 'forum_request_queries_sum{route="read_topic"}') == 3
+    assert sample(text, 'forum_request_rows_total{route="read_topic"}') == 7
+    assert sample(text, 'forum_request_db_seconds_total{route="read_topic"}') == 0.25
+    assert sample(text, 'forum_requests_total{route="read_topic",status="200"}') == 1
+
+
+def test_requests_are_recorded_per_route(client, registry):
+    assert client.get('/api/topic/0').status_code == 200
+    assert client.get('/api/topic/12345').status_code == 400
+    client.get('/nowhere')
+    text = client.get('/metrics').text
+    assert sample(text, 'forum_requests_total{route="read_topic",status="200"}') == 1
+    assert sample(text, 'forum_requests_total{route="read_topic",status="400"}') == 1
+    assert sample(text, 'forum_requests_total{route="unmatched",status="404"}') == 1
+    assert sample(text, 'forum_request_queries_sum{route="read_topic"}') > 0
+    assert sample(text, 'forum_request_rows_total{route="read_topic"}') > 0
+    assert sample(text, 'forum_request_serialization_seconds_total{route="read_topic"}') > 0
+
+
+def test_slow_requests_are_logged_with_statements(client, registry, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, 'SLOW_REQUEST_SECONDS', 0)
+    with caplog.at_level(logging.WARNING, logger='slow_requests'):
+        client.get('/api/topic/0')
+    [record] = caplog.records
+    assert record.getMessage().startswith('read_topic took ')
+    assert 'SELECT' in record.getMessage()
+
+
+@pytest.mark.parametrize('path, keys', [
+    ('/api/stats/pool', set()),
+    ('/api/stats/cache', {'hits', 'misses', 'revalidations'}),
+    ('/api/stats/events', {'subscribers', 'published', 'delivered'}),
+    ('/api/stats/admission', {'active', 'waiting', 'rejected', 'limited', 'store_failures'}),
+])
+def test_stats_endpoints(client, path, keys):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert keys <= set(response.json())
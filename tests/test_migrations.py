@@ -0,0 +1,100 @@
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, text
+from starlette.testclient import TestClient
+
+import main
+from db_definitions import Base, DBSession, engine, use_primary
+from db_interactions import repair_counters
+from migrations import HEAD, current_version, migrate
+from passwords import make_password
+from token_cache import hash_token
+from helpers import counters
+
+LEGACY_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, password_hash VARCHAR NOT NULL,
+        password_salt VARCHAR NOT NULL, token VARCHAR, token_expires_at DATETIME
+    )''',
+    'CREATE INDEX ix_users_token ON users (token)',
+    '''CREATE TABLE topics (
+        id INTEGER PRIMARY KEY, title VARCHAR,
+        parent_id INTEGER REFERENCES topics (id), user_id INTEGER REFERENCES users (id)
+    )''',
+    '''CREATE TABLE threads (
+        id INTEGER PRIMARY KEY, title VARCHAR, is_vegan BOOLEAN,
+        parent_id INTEGER REFERENCES topics (id), user_id INTEGER REFERENCES users (id)
+    )''',
+    '''CREATE TABLE posts (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users (id), text VARCHAR,
+        parent_id INTEGER REFERENCES threads (id)
+    )''',
+]
+
+
+@pytest.fixture
+def legacy(db):
+    with engine.begin() as connection:
+        for name in ('posts_fts', 'threads_fts'):
+            connection.execute(text(f'DROP TABLE IF EXISTS {name}'))
+    Base.metadata.drop_all(engine)
+    hash, salt = make_password('Password1')
+    expires_at = datetime.now() + timedelta(days=1)
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO users VALUES (0, 'root', :hash, :salt, NULL, NULL), (1, 'alice', :hash, :salt, 'old-token', :expires)"
+        ), {'hash': hash, 'salt': salt, 'expires': expires_at})
+        connection.execute(text(
+            "INSERT INTO topics VALUES (0, 'Home', NULL, 0), (1, 'child', 0, 1)"
+        ))
+        connection.execute(text("INSERT INTO threads VALUES (1, 'walnuts', 0, 0, 1)"))
+        connection.execute(text(
+            "INSERT INTO posts VALUES (1, 1, 'walnut bread', 1), (2, 1, 'pecan pie', 1)"
+        ))
+
+
+def test_legacy_database_migrates_to_head(legacy, caplog):
+    with caplog.at_level(logging.INFO, logger='migrations'):
+        migrate(engine)
+    assert [record.getMessage().split(' in ')[0] for record in caplog.records][-1] == f'applied {HEAD:03d} token_hash'
+    with engine.connect() as connection:
+        assert current_version(connection) == HEAD
+        assert 'ix_users_token' not in {index['name'] for index in inspect(connection).get_indexes('users')}
+        assert connection.execute(text('SELECT token, token_hash FROM users WHERE id = 1')).one() == \
+            (None, hash_token('old-token'))
+        for name in ('posts_fts', 'threads_fts'):
+            connection.execute(text(f"INSERT INTO {name}({name}) VALUES ('integrity-check')"))
+    session = DBSession()
+    use_primary(session)
+    try:
+        migrated = counters(session)
+        assert [row[:4] for row in migrated['topics']] == [(0, 1, 1, 2), (1, 0, 0, 0)]
+        repair_counters(session)
+        assert counters(session) == migrated
+    finally:
+        session.close()
+
+
+def test_migrating_again_is_a_no_op(legacy, caplog):
+    migrate(engine)
+    with engine.connect() as connection:
+        before = inspect(connection).get_table_names()
+    with caplog.at_level(logging.INFO, logger='migrations'):
+        migrate(engine)
+    assert caplog.records == []
+    with engine.connect() as connection:
+        assert inspect(connection).get_table_names() == before
+
+
+def test_old_tokens_work_after_hashing(legacy):
+    migrate(engine)
+    client = TestClient(main.app)
+    headers = {'Authorization': 'Bearer old-token'}
+    assert client.get('/api/user', headers=headers).json()['name'] == 'alice'
+    assert client.get('/api/search', params={'q': 'walnut'}).json()['data'][0]['post'] == 1
+    response = client.post('/api/thread', data={'title': 'new', 'parent_id': 0, 'is_vegan': True}, headers=headers)
+    assert response.status_code == 204
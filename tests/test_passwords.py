@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+import passwords
+from passwords import Pbkdf2Hasher, ScryptHasher, Sha512Hasher, check_password, check_password_async, hasher_for
+from passwords import make_password, needs_rehash
+from db_definitions import User
+from db_interactions import add_user
+from helpers import login
+
+
+@pytest.mark.parametrize('hasher', [Sha512Hasher(), Pbkdf2Hasher(10), ScryptHasher(2, 8, 1)])
+def test_hashes_verify_with_their_own_parameters(hasher):
+    password_hash = hasher.encode('Password1', 'salt')
+    assert hasher_for(password_hash).encode('Password1', 'salt') == password_hash
+    assert check_password('Password1', password_hash, 'salt')
+    assert not check_password('Password2', password_hash, 'salt')
+    assert not check_password('Password1', password_hash, 'pepper')
+
+
+def test_salts_differ_per_password():
+    assert make_password('Password1') != make_password('Password1')
+
+
+def test_outdated_hashes_need_rehash(monkeypatch):
+    monkeypatch.setattr(passwords, 'hasher', ScryptHasher(4, 8, 1))
+    assert needs_rehash(Sha512Hasher().encode('Password1', 'salt'))
+    assert needs_rehash(ScryptHasher(2, 8, 1).encode('Password1', 'salt'))
+    assert not needs_rehash(ScryptHasher(4, 8, 1).encode('Password1', 'salt'))
+
+
+def test_unknown_algorithm_is_an_error():
+    with pytest.raises(ValueError):
+        hasher_for('bcrypt$c=12$abc')
+
+
+def test_check_runs_in_executor():
+    password_hash, salt = make_password('Password1')
+    assert asyncio.run(check_password_async('Password1', password_hash, salt))
+
+
+def test_login_upgrades_legacy_hash(client, session):
+    add_user(session, 'legacy', Sha512Hasher().encode('Password1', 'salt'), 'salt')
+    login(client, 'legacy')
+    session.expire_all()
+    password_hash, salt = session.query(User.password_hash, User.password_salt)\
+        .filter(User.name == 'legacy').one()
+    assert password_hash.startswith('scrypt$')
+    assert salt != 'salt' and check_password('Password1', password_hash, salt)
+    login(client, 'legacy')
+    assert client.post('/api/authenticate', data={'username': 'legacy', 'password': 'wrong1'}).status_code == 400
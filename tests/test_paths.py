@@ -0,0 +1,28 @@
+from db_interactions import get_topic_path, get_topic_paths, get_thread_path
+from helpers import make_user, make_topic
+
+
+def chain(session, depth: int):
+    user_id = make_user(session, 'alice')
+    ids = [0]
+    for n in range(depth):
+        ids.append(make_topic(session, f'level {n + 1}', user_id, ids[-1]))
+    return ids
+
+
+def test_path_runs_from_root_to_topic(session):
+    ids = chain(session, 4)
+    path = get_topic_path(session, ids[-1])
+    assert [element['id'] for element in path] == ids
+    assert [element['title'] for element in path] == ['Home'] + [f'level {n}' for n in range(1, 5)]
+    assert get_thread_path(session, ids[2]) == path[:3]
+    assert get_thread_path(session, None) == []
+
+
+def test_paths_take_one_query_at_any_depth(session, statements):
+    ids = chain(session, 30)
+    statements.clear()
+    paths = get_topic_paths(session, [ids[3], ids[30], 999])
+    assert len(statements) == 1
+    assert len(paths[ids[3]]) == 4 and len(paths[ids[30]]) == 31
+    assert paths[999] == []
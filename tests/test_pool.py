@@ -0,0 +1,43 @@
+import os
+
+import pytest
+from sqlalchemy.exc import TimeoutError
+
+import db_definitions
+from db_definitions import engine, engines, make_engine, pool_stats
+from conftest import DIRECTORY
+
+
+def test_sqlite_connections_get_pragmas():
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        assert connection.exec_driver_sql('PRAGMA foreign_keys').scalar() == 0
+
+
+def test_pool_counts_checkouts_and_timeouts(monkeypatch):
+    monkeypatch.setattr(db_definitions, 'DB_POOL_SIZE', 1)
+    monkeypatch.setattr(db_definitions, 'DB_MAX_OVERFLOW', 0)
+    monkeypatch.setattr(db_definitions, 'DB_POOL_TIMEOUT', 0.01)
+    small = make_engine('test_pool', f'sqlite:///{os.path.join(DIRECTORY, "pool.sqlite")}')
+    try:
+        with small.connect():
+            with pytest.raises(TimeoutError):
+                small.connect()
+            stats = pool_stats()['test_pool']
+        assert (stats['checkouts'], stats['timeouts'], stats['checked_out']) == (1, 1, 1)
+        assert stats['wait_seconds_max'] >= 0.01
+        assert pool_stats()['test_pool']['checked_out'] == 0
+    finally:
+        engines.pop('test_pool')
+        small.dispose()
+
+
+def test_memory_sqlite_keeps_default_pool():
+    memory = make_engine('test_memory', 'sqlite://')
+    try:
+        assert 'test_memory' not in pool_stats()
+        with memory.connect() as connection:
+            assert connection.exec_driver_sql('SELECT 1').scalar() == 1
+    finally:
+        engines.pop('test_memory')
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from db_definitions import Post
+from db_interactions import add_posts, insert_posts
+from helpers import make_user, make_thread, login
+
+
+def post_texts(session):
+    return dict(session.query(Post.id, Post.text))
+
+
+def test_inserted_ids_match_their_rows(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    session.add(Post(user_id=user_id, text='gap', parent_id=thread_id, created_at=datetime.now()))
+    session.flush()
+    session.query(Post).delete()
+    rows = [
+        {'user_id': user_id, 'text': f'post {n}', 'parent_id': thread_id, 'created_at': datetime.now()}
+        for n in range(5)
+    ]
+    post_ids = insert_posts(session, rows)
+    session.commit()
+    texts = post_texts(session)
+    assert [texts[post_id] for post_id in post_ids] == [row['text'] for row in rows]
+
+
+def test_each_batch_id_belongs_to_its_post(session):
+    user_id = make_user(session, 'alice')
+    threads = [make_thread(session, f'thread {n}', user_id) for n in range(3)]
+    posts = [(threads[n % 3], user_id, f'post {n}') for n in range(10)]
+    assert add_posts(session, posts) == [True] * 10
+    texts = post_texts(session)
+    assert sorted(texts.values()) == sorted(text for _, _, text in posts)
+    assert dict(session.query(Post.text, Post.parent_id)) == {text: thread_id for thread_id, _, text in posts}
+
+
+def test_partial_batch_skips_missing_threads(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    posts = [(thread_id, user_id, 'a'), (999, user_id, 'lost'), (thread_id, user_id, 'b')]
+    assert add_posts(session, posts, False) == [True, False, True]
+    assert sorted(post_texts(session).values()) == ['a', 'b']
+
+
+def test_batch_is_rejected_when_any_thread_is_missing(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    assert add_posts(session, [(thread_id, user_id, 'a'), (999, user_id, 'b')]) == [True, False]
+    assert post_texts(session) == {}
+
+
+def test_batch_endpoint_sets_last_post(client, session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    headers = login(client, 'alice')
+    batch = {'posts': [{'threadId': thread_id, 'text': text} for text in ('first', 'second')]}
+    assert client.post('/api/messages', json=batch, headers=headers).status_code == 204
+    thread = client.get(f'/api/thread/{thread_id}').json()['data']
+    assert [post['text'] for post in thread['posts']] == ['first', 'second']
+    topic = client.get('/api/topic/0').json()['data']
+    assert topic['threads'][0]['numPosts'] == 2
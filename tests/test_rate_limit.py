@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+import redis
+import redis.asyncio
+
+import rate_limit
+from rate_limit import Limit, LocalBucketStore, RedisBucketStore, RateLimiter, ConcurrencyLimiter, parse_limits
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit, 'monotonic', lambda: now[0])
+    return now
+
+
+def take(store, key: str, limit: Limit) -> float:
+    return asyncio.run(store.take(key, limit))
+
+
+def test_parse_limits():
+    assert parse_limits(' a=1/2, b=0.5/10 ,') == {'a': Limit(1, 2), 'b': Limit(0.5, 10)}
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    store = LocalBucketStore(100)
+    limit = Limit(2, 3)
+    assert [take(store, 'k', limit) for _ in range(3)] == [0, 0, 0]
+    assert take(store, 'k', limit) == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert take(store, 'k', limit) == 0
+    assert take(store, 'other', limit) == 0
+
+
+def test_bucket_store_is_bounded(clock):
+    store = LocalBucketStore(2)
+    for key in 'abc':
+        take(store, key, Limit(1, 1))
+    assert list(store.buckets) == ['b', 'c']
+
+
+def test_zero_rate_disables_limit():
+    limiter = RateLimiter(LocalBucketStore(10), {'route': Limit(0, 0)}, Limit(1, 1))
+    assert all(asyncio.run(limiter.retry_after('ip', 'x', 'route')) == 0 for _ in range(5))
+    assert asyncio.run(limiter.retry_after('ip', 'x', 'other')) == 0
+    assert asyncio.run(limiter.retry_after('ip', 'x', 'other')) > 0
+    assert limiter.stats() == {'limited': 1, 'store_failures': 0}
+
+
+def test_redis_store_fails_open():
+    client = redis.asyncio.Redis.from_url('redis://127.0.0.1:1', socket_timeout=0.05, socket_connect_timeout=0.05)
+    store = RedisBucketStore(client, (redis.RedisError, OSError, asyncio.TimeoutError))
+    limiter = RateLimiter(store, {}, Limit(1, 1))
+    assert asyncio.run(limiter.retry_after('ip', 'x', 'route')) == 0
+    assert limiter.stats() == {'limited': 0, 'store_failures': 1}
+
+
+def test_concurrency_limiter_queues_then_rejects():
+    async def scenario():
+        limiter = ConcurrencyLimiter(1, 1, 0.05)
+        assert await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not await limiter.acquire()
+        limiter.release()
+        assert await waiter
+        assert not await limiter.acquire()
+        limiter.release()
+        return limiter.stats()
+
+    assert asyncio.run(scenario()) == {'active': 0, 'waiting': 0, 'rejected': 2}
+
+
+def test_limited_route_answers_429(client, monkeypatch):
+    limiter = RateLimiter(LocalBucketStore(10), {'read_topic': Limit(1, 2)}, Limit(0, 0))
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    statuses = [client.get('/api/topic/0').status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.get('/api/topic/0')
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_anonymous_reads_are_limited_per_ip_by_default():
+    assert rate_limit.ROUTE_LIMITS['read_thread'] == rate_limit.READ_LIMIT
+    assert {'read_topic', 'read_thread', 'read_batch', 'read_search'} <= set(rate_limit.ROUTE_LIMITS)
+
+
+def test_login_limit_is_keyed_by_ip_and_name(client, session, monkeypatch):
+    from helpers import make_user
+    make_user(session, 'victim')
+    limiter = RateLimiter(LocalBucketStore(10), {'request_token': Limit(1, 2)}, Limit(0, 0))
+    monkeypatch.setattr(rate_limit, 'rate_limiter', limiter)
+    monkeypatch.setattr('main.rate_limiter', limiter)
+    monkeypatch.setattr(rate_limit, 'client_ip', lambda scope: 'attacker')
+    for _ in range(2):
+        client.post('/api/authenticate', data={'username': 'victim', 'password': 'wrong'})
+    assert client.post('/api/authenticate', data={'username': 'victim', 'password': 'wrong'}).status_code == 429
+    monkeypatch.setattr(rate_limit, 'client_ip', lambda scope: 'victim')
+    monkeypatch.setattr('main.client_ip', lambda scope: 'victim')
+    response = client.post('/api/authenticate', data={'username': 'victim', 'password': 'Password1'})
+    assert response.status_code == 200
@@ -0,0 +1,95 @@
+from db_definitions import Topic, Thread, Post
+from db_interactions import remove_post, remove_thread, remove_topic, repair_counters
+from helpers import make_user, make_topic, make_thread, make_post, counters
+
+
+def orphans(session):
+    return {
+        'topics': session.query(Topic.id).filter(Topic.id != 0, ~Topic.parent_id.in_(session.query(Topic.id))).all(),
+        'threads': session.query(Thread.id).filter(~Thread.parent_id.in_(session.query(Topic.id))).all(),
+        'posts': session.query(Post.id).filter(~Post.parent_id.in_(session.query(Thread.id))).all()
+    }
+
+
+def assert_counters_consistent(session):
+    before = counters(session)
+    repair_counters(session)
+    assert counters(session) == before
+
+
+def tree(session):
+    alice, bob = make_user(session, 'alice'), make_user(session, 'bob')
+    root = make_topic(session, 'root', alice)
+    child = make_topic(session, 'child', bob, root)
+    grandchild = make_topic(session, 'grandchild', alice, child)
+    sibling = make_topic(session, 'sibling', bob)
+    threads = [make_thread(session, f'thread {n}', bob if n % 2 else alice, topic)
+               for n, topic in enumerate([root, child, grandchild, sibling])]
+    for thread_id in threads:
+        for n in range(3):
+            make_post(session, f'post {n}', bob if n % 2 else alice, thread_id)
+    return alice, bob, root, sibling, threads
+
+
+def test_topic_subtree_is_removed_whatever_its_owners(session):
+    alice, bob, root, sibling, threads = tree(session)
+    assert not remove_topic(session, root, bob)
+    assert session.query(Topic).count() == 5
+    assert remove_topic(session, root, alice)
+    assert [id for id, in session.query(Topic.id).order_by(Topic.id)] == [0, sibling]
+    assert [id for id, in session.query(Thread.id)] == [threads[3]]
+    assert session.query(Post).count() == 3
+    assert orphans(session) == {'topics': [], 'threads': [], 'posts': []}
+    assert_counters_consistent(session)
+
+
+def test_missing_topic_is_not_removed(session):
+    alice = make_user(session, 'alice')
+    assert not remove_topic(session, 42, alice)
+
+
+def test_thread_removal_checks_owner_and_updates_counters(session):
+    alice, bob, root, sibling, threads = tree(session)
+    assert not remove_thread(session, threads[0], bob)
+    assert session.query(Post).filter(Post.parent_id == threads[0]).count() == 3
+    assert remove_thread(session, threads[0], alice)
+    assert session.query(Thread).filter(Thread.id == threads[0]).count() == 0
+    assert orphans(session)['posts'] == []
+    assert_counters_consistent(session)
+
+
+def test_post_removal_checks_owner_and_updates_last_post(session):
+    alice, bob, root, sibling, threads = tree(session)
+    last = session.query(Thread.last_post_id).filter(Thread.id == threads[0]).scalar()
+    assert session.query(Post.user_id).filter(Post.id == last).scalar() == alice
+    assert not remove_post(session, last, bob)
+    assert remove_post(session, last, alice)
+    assert session.query(Thread.last_post_id).filter(Thread.id == threads[0]).scalar() < last
+    assert_counters_consistent(session)
+
+
+def test_removed_rows_leave_the_search_index(client, session):
+    alice, bob, root, sibling, threads = tree(session)
+    assert client.get('/api/search', params={'q': 'post'}).json()['data']
+    remove_topic(session, root, alice)
+    remove_topic(session, sibling, bob)
+    assert client.get('/api/search', params={'q': 'post'}).json()['data'] == []
+    assert client.get('/api/search', params={'q': 'thread', 'kind': 'threads'}).json()['data'] == []
+
+
+def test_subtree_delete_is_set_based(session, statements):
+    user_id = make_user(session, 'alice')
+
+    def remove_statements(width: int) -> int:
+        root = make_topic(session, 'root', user_id)
+        parents = [root]
+        for depth in range(3):
+            parents = [make_topic(session, f'topic {depth}', user_id, parent) for parent in parents for _ in range(width)]
+        for parent in parents:
+            make_post(session, 'post', user_id, make_thread(session, 'thread', user_id, parent))
+        statements.clear()
+        assert remove_topic(session, root, user_id)
+        return len(statements)
+
+    assert remove_statements(1) == remove_statements(3)
+    assert orphans(session) == {'topics': [], 'threads': [], 'posts': []}
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+from itertools import cycle
+
+import pytest
+
+from db_definitions import ReplicaSession, Thread, engine, engines, make_engine
+from helpers import make_user, login
+from conftest import DIRECTORY
+
+
+@pytest.fixture
+def replica(session, monkeypatch):
+    make_user(session, 'alice')
+    path = os.path.join(DIRECTORY, 'replica.sqlite')
+    source, target = sqlite3.connect(engine.url.database), sqlite3.connect(path)
+    source.backup(target)
+    target.execute("UPDATE topics SET title = 'from replica' WHERE id = 0")
+    target.commit()
+    source.close()
+    target.close()
+    replica_engine = make_engine('replica_test', f'sqlite:///{path}')
+    monkeypatch.setattr(ReplicaSession, 'replicas', cycle([replica_engine]))
+    yield
+    engines.pop('replica_test')
+    replica_engine.dispose()
+    os.remove(path)
+
+
+def test_anonymous_reads_never_touch_the_primary(client, replica, statements):
+    response = client.get('/api/topic/0')
+    assert response.json()['data']['title'] == 'from replica'
+    assert client.get('/api/topic/0', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/batch', params={'topic_id': 0}).json()['data']['topics'][0]['data']['title'] == 'from replica'
+    assert statements == []
+
+
+def test_writer_reads_own_writes_from_primary(client, replica, session):
+    headers = login(client, 'alice')
+    response = client.post('/api/thread', data={'title': 'new', 'parent_id': 0, 'is_vegan': True}, headers=headers)
+    assert response.status_code == 204
+    assert session.query(Thread).count() == 1
+
+    anonymous = client.get('/api/topic/0').json()['data']
+    assert anonymous['title'] == 'from replica'
+    assert anonymous['threads'] == []
+
+    own = client.get('/api/topic/0', headers=headers).json()['data']
+    assert own['title'] != 'from replica'
+    assert [thread['title'] for thread in own['threads']] == ['new']
@@ -0,0 +1,62 @@
+import pytest
+
+import response_cache as response_cache_module
+from response_cache import CachedResponse, ResponseCache, response_cache
+from db_definitions import Topic
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module, 'monotonic', lambda: now[0])
+    return now
+
+
+def entry(body: bytes = b'{}', etag: str = '"e"') -> CachedResponse:
+    return CachedResponse(body, etag, {})
+
+
+def test_entries_are_fresh_within_revalidation_window(clock):
+    cache = ResponseCache(1000, 2)
+    cache.set(('topic', 1), None, entry(), 0)
+    cached = cache.get(('topic', 1), None)
+    assert cache.is_fresh(('topic', 1), None, cached)
+    clock[0] += 2
+    assert not cache.is_fresh(('topic', 1), None, cached)
+    cache.revalidated(('topic', 1), None, cached)
+    assert cache.is_fresh(('topic', 1), None, cached)
+    assert cache.stats()['revalidations'] == 1
+
+
+def test_invalidated_and_evicted_entries_are_not_fresh(clock):
+    cache = ResponseCache(4, 60)
+    cache.set(('topic', 1), None, entry(b'ab'), 0)
+    first = cache.get(('topic', 1), None)
+    cache.invalidate(('topic', 1))
+    assert not cache.is_fresh(('topic', 1), None, first)
+    cache.set(('topic', 1), None, entry(b'ab'), 1)
+    cache.set(('topic', 2), None, entry(b'abc'), 0)
+    assert cache.get(('topic', 1), None) is None
+    assert cache.checked_at.keys() == {(('topic', 2), None)}
+
+
+def test_single_worker_serves_hits_without_database(client, statements, monkeypatch):
+    monkeypatch.setattr(response_cache, 'revalidate', float('inf'))
+    etag = client.get('/api/topic/0').headers['ETag']
+    statements.clear()
+    assert client.get('/api/topic/0').headers['ETag'] == etag
+    assert client.get('/api/topic/0', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/batch', params={'topic_id': 0}).status_code == 200
+    assert statements == []
+
+
+def test_hits_revalidate_after_window(client, session, clock, monkeypatch):
+    monkeypatch.setattr(response_cache, 'revalidate', 5)
+    assert client.get('/api/topic/0').json()['data']['title'] == 'Home'
+    session.query(Topic).filter(Topic.id == 0)\
+        .update({Topic.title: 'Elsewhere', Topic.version: Topic.version + 1})
+    session.commit()
+    assert client.get('/api/topic/0').json()['data']['title'] == 'Home'
+    clock[0] += 5
+    assert client.get('/api/topic/0').json()['data']['title'] == 'Elsewhere'
+    assert client.get('/api/batch', params={'topic_id': 0}).json()['data']['topics'][0]['data']['title'] == 'Elsewhere'
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import text
+
+from db_definitions import Post
+from db_interactions import add_posts, remove_post, remove_thread
+from search import fts_query
+from helpers import make_user, make_topic, make_thread, make_post
+
+
+def integrity_check(session):
+    for name in ('posts_fts', 'threads_fts'):
+        session.execute(text(f"INSERT INTO {name}({name}) VALUES ('integrity-check')"))
+
+
+def search(client, q: str, **params):
+    response = client.get('/api/search', params={'q': q, **params})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_index_stays_consistent_with_writes(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'walnut recipes', user_id)
+    post_ids = [make_post(session, f'walnut bread {n}', user_id, thread_id) for n in range(3)]
+    add_posts(session, [(thread_id, user_id, 'pecan pie'), (thread_id, user_id, 'walnut cake')])
+    remove_post(session, post_ids[0], user_id)
+    integrity_check(session)
+    remove_thread(session, thread_id, user_id)
+    integrity_check(session)
+
+
+def test_search_finds_posts_and_threads(client, session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'walnut recipes', user_id)
+    post_id = make_post(session, 'a loaf of walnut bread', user_id, thread_id)
+    make_post(session, 'pecan pie', user_id, thread_id)
+    [result] = search(client, 'walnut bread')['data']
+    assert (result['link'], result['post'], result['title']) == (thread_id, post_id, 'walnut recipes')
+    assert 'walnut' in result['snippet']
+    assert result['user'] == {'id': user_id, 'name': 'alice'}
+    [thread] = search(client, 'recipes', kind='threads')['data']
+    assert thread['link'] == thread_id and thread['post'] is None
+
+
+def test_search_pages_and_scopes(client, session):
+    user_id = make_user(session, 'alice')
+    inside = make_topic(session, 'inside', user_id)
+    nested = make_thread(session, 'nested', user_id, make_topic(session, 'deeper', user_id, inside))
+    outside = make_thread(session, 'outside', user_id)
+    for n in range(3):
+        make_post(session, f'walnut {n}', user_id, nested)
+        make_post(session, f'walnut {n}', user_id, outside)
+    first = search(client, 'walnut', limit=4)
+    second = search(client, 'walnut', limit=4, offset=first['nextOffset'])
+    assert first['nextOffset'] == 4 and second['nextOffset'] is None
+    assert len({result['post'] for result in first['data'] + second['data']}) == 6
+    scoped = search(client, 'walnut', topic_id=inside)['data']
+    assert {result['link'] for result in scoped} == {nested}
+
+
+@pytest.mark.parametrize('query', ['"', 'c++', "don't", 'AND OR NOT', 'NEAR(a b)', '*', 'walnut:', '-walnut'])
+def test_punctuation_is_not_query_syntax(client, session, query):
+    user_id = make_user(session, 'alice')
+    make_post(session, "don't use c++ AND walnut", user_id, make_thread(session, 'thread', user_id))
+    search(client, query)
+
+
+def test_fts_query_quotes_words():
+    assert fts_query('c++ "walnut" OR bread*') == '"c" "walnut" "OR" "bread"'
+    assert fts_query('"+-') == ''
+
+
+def test_blank_query_is_rejected(client):
+    assert client.get('/api/search', params={'q': '  '}).status_code == 400
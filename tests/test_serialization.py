@@ -0,0 +1,42 @@
+import json
+
+import read_models
+import schema
+from bench_serialization import orm_pipeline, read_model_pipeline
+from db_interactions import get_topic
+from read_models import render_json, split_template, stream_array, topic_response
+from helpers import make_user, make_topic, make_thread, make_post
+
+
+def test_thread_body_matches_pydantic_pipeline(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id, make_topic(session, 'child', user_id))
+    for n in range(5):
+        make_post(session, f'post "{n}" ü', user_id, thread_id)
+    fast = read_model_pipeline(session, thread_id, 3)
+    slow = orm_pipeline(session, thread_id, 3)
+    assert {**json.loads(fast), 'nextCursor': None} == json.loads(slow)
+    assert schema.ThreadResponse.parse_raw(fast).nextCursor is not None
+
+
+def test_topic_body_validates_against_schema(session):
+    user_id = make_user(session, 'alice')
+    make_topic(session, 'child', user_id)
+    make_post(session, 'post', user_id, make_thread(session, 'thread', user_id))
+    body = render_json(topic_response(get_topic(session, 0)))
+    parsed = schema.TopicResponse.parse_raw(body)
+    assert json.loads(parsed.json()) == json.loads(body)
+
+
+def test_json_fallback_renders_same_bytes(monkeypatch):
+    data = {'title': 'ü "quoted"', 'n': [1, 2.5, None, True], 'nested': {'a': []}}
+    fast = render_json(data)
+    monkeypatch.setattr(read_models, 'orjson', None)
+    assert render_json(data) == fast
+
+
+def test_streamed_array_matches_rendered_array():
+    rows = [(n, f'post {n}', n, f'user {n}') for n in range(7)]
+    head, tail = split_template({'type': 'thread', 'data': {'posts': []}}, 'posts')
+    streamed = head + b''.join(stream_array(read_models.post_data, rows, 3)) + tail
+    assert streamed == render_json({'type': 'thread', 'data': {'posts': [read_models.post_data(*row) for row in rows]}})
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import signed_tokens
+from signed_tokens import TokenClaims, make_signed_token, read_signed_token, check_token_settings
+from token_cache import RedisTokenCache
+from helpers import FakeRedis
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(signed_tokens, 'TOKEN_SECRET', b'test secret')
+
+
+def claims(generation: int = 0) -> TokenClaims:
+    return TokenClaims(7, 'alice', generation, datetime.now().replace(microsecond=0) + timedelta(hours=1))
+
+
+def test_round_trip(secret):
+    assert read_signed_token(make_signed_token(claims(3))) == claims(3)
+
+
+def test_tampered_token_is_rejected(secret):
+    body, _, signature = make_signed_token(claims()).partition('.')
+    other_body, _, _ = make_signed_token(claims(1)).partition('.')
+    assert read_signed_token(f'{other_body}.{signature}') is None
+    assert read_signed_token(body) is None
+
+
+def test_secret_is_required(monkeypatch):
+    monkeypatch.setattr(signed_tokens, 'TOKEN_SECRET', None)
+    with pytest.raises(RuntimeError, match='TOKEN_SECRET'):
+        check_token_settings('redis://cache')
+
+
+def test_single_worker_uses_local_generations(secret, monkeypatch):
+    monkeypatch.setattr(signed_tokens, 'WEB_CONCURRENCY', 1)
+    check_token_settings(None)
+
+
+def test_several_workers_need_shared_cache(secret, monkeypatch):
+    monkeypatch.setattr(signed_tokens, 'WEB_CONCURRENCY', 4)
+    with pytest.raises(RuntimeError, match='TOKEN_CACHE_URL'):
+        check_token_settings(None)
+    check_token_settings('redis://cache')
+
+
+def test_generations_are_cached_in_process(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('token_cache.monotonic', lambda: now[0])
+    client = FakeRedis()
+    cache = RedisTokenCache(client, 300, 5)
+    client.set('token_generation:7', 2)
+    assert cache.get_generation(7) == 2
+    assert cache.get_generation(7) == 2
+    assert client.calls.count(('get', 'token_generation:7')) == 1
+
+    client.set('token_generation:7', 3)
+    assert cache.get_generation(7) == 2
+    now[0] += 5
+    assert cache.get_generation(7) == 3
+
+
+def test_set_generation_applies_locally_at_once():
+    client = FakeRedis()
+    cache = RedisTokenCache(client, 300, 5)
+    assert cache.get_generation(7) is None
+    cache.set_generation(7, 4)
+    assert cache.get_generation(7) == 4
+    cache.set_generation(7, 2)
+    assert client.get('token_generation:7') == b'4'
+
+
+@pytest.mark.parametrize('token', [
+    '', '.', 'abc', 'abc.def.ghi', 'ünïcode.sïgnature', 'body.ü', '\x00.\x00', 'a' * 4096
+])
+def test_malformed_tokens_are_rejected(secret, token):
+    assert read_signed_token(token) is None
+
+
+def test_non_ascii_body_with_valid_signature_is_rejected(secret):
+    body = 'ü'
+    assert read_signed_token(f'{body}.{signed_tokens.sign(body)}') is None
+
+
+def test_non_ascii_bearer_token_is_unauthorized(client, secret, monkeypatch):
+    monkeypatch.setattr('db_interactions.SIGNED_TOKENS', True)
+    response = client.get('/api/user', headers={'Authorization': 'Bearer ünïcode.sïgnature'})
+    assert response.status_code == 401
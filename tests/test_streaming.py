@@ -0,0 +1,62 @@
+import asyncio
+
+from db_definitions import DBSession
+from db_interactions import get_thread, get_topic, get_thread_snapshot, get_topic_snapshot, stream_thread, stream_topic
+from read_models import render_json, thread_response, topic_response
+import main
+from helpers import make_user, make_topic, make_thread, make_post
+
+
+def streamed_thread(thread_id, cursor, limit):
+    session = DBSession()
+    version, thread, next_cursor = get_thread_snapshot(session, thread_id, cursor, limit)
+    return b''.join(stream_thread(session, thread_id, cursor, limit, thread, next_cursor))
+
+
+def test_streamed_pages_match_buffered_pages(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    post_ids = [make_post(session, f'post {n}', user_id, thread_id) for n in range(5)]
+    for cursor, limit in [(None, None), (None, 2), (post_ids[1], 2), (post_ids[2], 2), (post_ids[0], 10)]:
+        thread, next_cursor = get_thread(session, thread_id, cursor, limit or 100)
+        assert streamed_thread(thread_id, cursor, limit) == render_json(thread_response(thread, next_cursor))
+
+
+def test_streamed_topic_matches_buffered_topic(session):
+    user_id = make_user(session, 'alice')
+    make_topic(session, 'child', user_id)
+    make_thread(session, 'thread', user_id)
+    stream_db = DBSession()
+    version, topic = get_topic_snapshot(stream_db, 0)
+    assert b''.join(stream_topic(stream_db, 0, topic)) == render_json(topic_response(get_topic(session, 0)))
+
+
+def test_stream_reads_one_snapshot(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    make_post(session, 'before', user_id, thread_id)
+    stream_db = DBSession()
+    version, thread, next_cursor = get_thread_snapshot(stream_db, thread_id, None, None)
+    make_post(session, 'after', user_id, thread_id)
+    body = b''.join(stream_thread(stream_db, thread_id, None, None, thread, next_cursor))
+    assert b'before' in body and b'after' not in body
+    with DBSession() as other:
+        assert get_thread_snapshot(other, thread_id, None, None)[0] > version
+
+
+def test_stream_etag_covers_row_range(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+
+    def etag(cursor, limit):
+        response = asyncio.run(main.stream_thread_response(thread_id, cursor, limit, '*', None, DBSession()))
+        assert response.status_code == 304
+        return response.headers['ETag']
+
+    assert len({etag(None, None), etag(None, 2), etag(None, 3), etag(5, 2)}) == 4
+
+
+def test_missing_rows_are_rejected(session):
+    with DBSession() as thread_db, DBSession() as topic_db:
+        assert get_thread_snapshot(thread_db, 42, None, None) is None
+        assert get_topic_snapshot(topic_db, 42) is None
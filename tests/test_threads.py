@@ -0,0 +1,35 @@
+from db_interactions import get_thread, remove_post
+from helpers import make_user, make_thread, make_post
+
+
+def test_keyset_pages_cover_thread_once(client, session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    post_ids = [make_post(session, f'post {n}', user_id, thread_id) for n in range(7)]
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 3} if cursor is None else {'limit': 3, 'cursor': cursor}
+        page = client.get(f'/api/thread/{thread_id}', params=params).json()
+        seen += [post['id'] for post in page['data']['posts']]
+        cursor = page['nextCursor']
+        if cursor is None:
+            break
+    assert seen == post_ids
+
+
+def test_page_survives_deleted_posts(session):
+    user_id = make_user(session, 'alice')
+    thread_id = make_thread(session, 'thread', user_id)
+    post_ids = [make_post(session, f'post {n}', user_id, thread_id) for n in range(5)]
+    thread, cursor = get_thread(session, thread_id, None, 2)
+    assert cursor == post_ids[1]
+    assert remove_post(session, post_ids[2], user_id)
+    thread, cursor = get_thread(session, thread_id, cursor, 2)
+    assert [post['id'] for post in thread['posts']] == post_ids[3:]
+    assert cursor is None
+
+
+def test_missing_thread(client, session):
+    assert get_thread(session, 42, None, 10) is None
+    assert client.get('/api/thread/42').status_code == 400
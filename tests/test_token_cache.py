@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import token_cache as token_cache_module
+from token_cache import CachedUser, LocalTokenCache, RedisTokenCache
+from helpers import FakeRedis, make_user, login
+
+EXPIRES_AT = datetime(2030, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(token_cache_module, 'monotonic', lambda: now[0])
+    return now
+
+
+def advance(cache, clock, seconds: float):
+    clock[0] += seconds
+    if isinstance(cache, RedisTokenCache):
+        cache.client.now += seconds
+
+
+@pytest.fixture(params=['local', 'redis'])
+def cache(request, clock):
+    if request.param == 'local':
+        return LocalTokenCache(3, 60)
+    return RedisTokenCache(FakeRedis(), 60, 5)
+
+
+def test_get_and_set(cache):
+    assert cache.get('a') is None
+    cache.set('a', CachedUser(1, 'alice', EXPIRES_AT))
+    assert cache.get('a') == CachedUser(1, 'alice', EXPIRES_AT)
+
+
+def test_delete_user_invalidates_all_their_tokens(cache):
+    cache.set('a', CachedUser(1, 'alice', EXPIRES_AT))
+    cache.set('b', CachedUser(1, 'alice', EXPIRES_AT))
+    cache.set('c', CachedUser(2, 'bob', EXPIRES_AT))
+    cache.delete_user(1)
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert cache.get('c') == CachedUser(2, 'bob', EXPIRES_AT)
+
+
+def test_entries_expire(cache, clock):
+    cache.set('a', CachedUser(1, 'alice', EXPIRES_AT))
+    advance(cache, clock, 59)
+    assert cache.get('a') is not None
+    advance(cache, clock, 2)
+    assert cache.get('a') is None
+
+
+def test_local_cache_evicts_least_recently_used(clock):
+    cache = LocalTokenCache(2, 60)
+    cache.set('a', CachedUser(1, 'alice', EXPIRES_AT))
+    cache.set('b', CachedUser(2, 'bob', EXPIRES_AT))
+    cache.get('a')
+    cache.set('c', CachedUser(3, 'carol', EXPIRES_AT))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert 2 not in cache.user_keys
+
+
+def test_require_user_uses_cache_and_new_login_revokes_old_token(client, session):
+    make_user(session, 'alice')
+    old = login(client, 'alice')
+    assert client.get('/api/user', headers=old).json()['name'] == 'alice'
+    assert len(token_cache_module.token_cache.entries) == 1
+    new = login(client, 'alice')
+    assert client.get('/api/user', headers=old).status_code == 401
+    assert client.get('/api/user', headers=new).status_code == 200
+
+
+def test_expired_token_is_rejected(client, session):
+    from db_definitions import User
+    user_id = make_user(session, 'alice')
+    headers = login(client, 'alice')
+    session.query(User).filter(User.id == user_id)\
+        .update({User.token_expires_at: datetime.now() - timedelta(seconds=1)})
+    session.commit()
+    token_cache_module.token_cache.delete_user(user_id)
+    assert client.get('/api/user', headers=headers).status_code == 401
@@ -0,0 +1,37 @@
+from db_interactions import get_topic
+from helpers import make_user, make_topic, make_thread, make_post
+
+
+def test_listing_shows_child_counts(client, session):
+    user_id = make_user(session, 'alice')
+    child = make_topic(session, 'child', user_id)
+    make_topic(session, 'grandchild', user_id, child)
+    make_thread(session, 'nested', user_id, child)
+    thread_id = make_thread(session, 'thread', user_id)
+    for n in range(3):
+        make_post(session, f'post {n}', user_id, thread_id)
+    topic = client.get('/api/topic/0').json()['data']
+    [listed_topic] = topic['topics']
+    assert (listed_topic['link'], listed_topic['numTopics'], listed_topic['numThreads']) == (child, 1, 1)
+    assert listed_topic['user'] == {'id': user_id, 'name': 'alice'}
+    [listed_thread] = topic['threads']
+    assert (listed_thread['link'], listed_thread['numPosts']) == (thread_id, 3)
+    assert listed_thread['lastPost'] is not None
+
+
+def test_listing_query_count_does_not_grow_with_children(session, statements):
+    user_id = make_user(session, 'alice')
+
+    def count_statements() -> int:
+        session.expire_all()
+        statements.clear()
+        get_topic(session, 0)
+        return len(statements)
+
+    make_thread(session, 'thread', user_id, make_topic(session, 'child', user_id))
+    few = count_statements()
+    for n in range(10):
+        child = make_topic(session, f'child {n}', user_id)
+        make_thread(session, f'thread {n}', user_id, child)
+        make_thread(session, f'root thread {n}', user_id)
+    assert count_statements() == few
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+from typing import Optional, NamedTuple, Dict, Set, Tuple
+import json
+import os
+
+TOKEN_CACHE_SIZE = int(os.environ['TOKEN_CACHE_SIZE']) if 'TOKEN_CACHE_SIZE' in os.environ else 10000
+TOKEN_CACHE_TTL = float(os.environ['TOKEN_CACHE_TTL']) if 'TOKEN_CACHE_TTL' in os.environ else 300
+TOKEN_CACHE_URL = os.environ['TOKEN_CACHE_URL'] if 'TOKEN_CACHE_URL' in os.environ else None
+TOKEN_GENERATION_TTL = float(os.environ['TOKEN_GENERATION_TTL']) if 'TOKEN_GENERATION_TTL' in os.environ else 5
+
+
+class CachedUser(NamedTuple):
+    user_id: int
+    name: str
+    expires_at: datetime
+
+
+def hash_token(token: str) -> str:
+    return sha256(token.encode('utf-8')).hexdigest()
+
+
+class LocalTokenCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.user_keys: Dict[int, Set[str]] = {}
+        self.generations: Dict[int, int] = {}
+        self.lock = Lock()
+
+    def get(self, key: str) -> Optional[CachedUser]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, stored_until = entry
+            if monotonic() > stored_until:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return user
+
+    def set(self, key: str, user: CachedUser):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (user, monotonic() + self.ttl)
+            self.user_keys.setdefault(user.user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def delete_user(self, user_id: int):
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def get_generation(self, user_id: int) -> Optional[int]:
+        return self.generations.get(user_id)
+
+    def set_generation(self, user_id: int, generation: int):
+        with self.lock:
+            self.generations[user_id] = max(generation, self.generations.get(user_id, 0))
+
+    def _remove(self, key: str):
+        user, _ = self.entries.pop(key)
+        keys = self.user_keys[user.user_id]
+        keys.discard(key)
+        if not keys:
+            del self.user_keys[user.user_id]
+
+
+class RedisTokenCache:
+    def __init__(self, client, ttl: float, generation_ttl: float):
+        self.client = client
+        self.ttl = int(ttl)
+        self.generation_ttl = generation_ttl
+        self.generations: Dict[int, Tuple[Optional[int], float]] = {}
+
+    def get(self, key: str) -> Optional[CachedUser]:
+        data = self.client.get(f'token:{key}')
+        if data is None:
+            return None
+        user_id, name, expires_at = json.loads(data)
+        return CachedUser(user_id, name, datetime.fromisoformat(expires_at))
+
+    def set(self, key: str, user: CachedUser):
+        data = json.dumps([user.user_id, user.name, user.expires_at.isoformat()])
+        user_key = f'user_tokens:{user.user_id}'
+        pipeline = self.client.pipeline()
+        pipeline.setex(f'token:{key}', self.ttl, data)
+        pipeline.sadd(user_key, key)
+        pipeline.expire(user_key, self.ttl)
+        pipeline.execute()
+
+    def delete_user(self, user_id: int):
+        user_key = f'user_tokens:{user_id}'
+        keys = self.client.smembers(user_key)
+        pipeline = self.client.pipeline()
+        for key in keys:
+            pipeline.delete(f'token:{key.decode("ascii")}')
+        pipeline.delete(user_key)
+        pipeline.execute()
+
+    def get_generation(self, user_id: int) -> Optional[int]:
+        cached = self.generations.get(user_id)
+        if cached is not None and monotonic() < cached[1]:
+            return cached[0]
+        generation = self.client.get(f'token_generation:{user_id}')
+        generation = int(generation) if generation is not None else None
+        self.generations[user_id] = (generation, monotonic() + self.generation_ttl)
+        return generation
+
+    def set_generation(self, user_id: int, generation: int):
+        key = f'token_generation:{user_id}'
+        self.generations.pop(user_id, None)
+        current = self.get_generation(user_id)
+        if current is None or generation > current:
+            self.client.set(key, generation)
+            self.generations[user_id] = (generation, monotonic() + self.generation_ttl)
+
+
+def make_token_cache():
+    if TOKEN_CACHE_URL is not None:
+        import redis
+        return RedisTokenCache(redis.Redis.from_url(TOKEN_CACHE_URL), TOKEN_CACHE_TTL, TOKEN_GENERATION_TTL)
+    return LocalTokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+token_cache = make_token_cache()
@@ -1,7 +1,9 @@
-from hashlib import sha512
+import os
 import secrets
 import string
 
+WEB_CONCURRENCY = int(os.environ['WEB_CONCURRENCY']) if 'WEB_CONCURRENCY' in os.environ else 1
+
 ALPHABET = (string.digits + string.ascii_letters).encode('ascii')
 
 
@@ -9,31 +11,6 @@ def make_token():
     return secrets.token_urlsafe(512)
 
 
-def make_salt():
-    return secrets.token_urlsafe(512)
-
-
-def make_password(password: str) -> (str, str):
-    salt = make_salt()
-    hasher = sha512()
-    hasher.update(password.encode('ascii'))
-    hasher.update(salt.encode('ascii'))
-    password_hash = hasher.hexdigest()
-    return password_hash, salt
-
-
-def check_password(
-    password: str, 
-    password_hash: str, 
-    password_salt: str
-) -> bool:
-    hasher = sha512()
-    hasher.update(password.encode('ascii'))
-    hasher.update(password_salt.encode('ascii'))
-    digest = hasher.hexdigest()
-    return digest == password_hash
-
-
 def password_is_good(password: str):
     return len(password) < 256 and all(
         ord(c) in ALPHABET
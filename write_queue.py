@@ -0,0 +1,63 @@
+from typing import List, Tuple, Callable, Awaitable, Optional
+import asyncio
+import os
+
+WRITE_BEHIND_WINDOW = float(os.environ['WRITE_BEHIND_WINDOW']) if 'WRITE_BEHIND_WINDOW' in os.environ else 0
+WRITE_BEHIND_MAX_BATCH = int(os.environ['WRITE_BEHIND_MAX_BATCH']) if 'WRITE_BEHIND_MAX_BATCH' in os.environ else 500
+
+PendingPost = Tuple[int, int, str]
+
+
+class PostQueue:
+    def __init__(
+            self, window: float, max_batch: int,
+            flush: Callable[[List[PendingPost]], Awaitable[List[bool]]]
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self.flush = flush
+        self.pending: List[Tuple[PendingPost, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.posts = 0
+
+    async def submit(self, post: PendingPost) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((post, future))
+        if len(self.pending) >= self.max_batch:
+            self.flush_pending()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush_pending)
+        return await future
+
+    def flush_pending(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self.write(batch))
+
+    async def write(self, batch: List[Tuple[PendingPost, asyncio.Future]]):
+        try:
+            results = await self.flush([post for post, _ in batch])
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        self.posts += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'window': self.window,
+            'max_batch': self.max_batch,
+            'pending': len(self.pending),
+            'batches': self.batches,
+            'posts': self.posts
+        }